@@ -0,0 +1,204 @@
+"""
+Read-only JSON API (/api/v1) over the datasets, for dashboards that need the
+numbers and not the Plotly figures.
+    /api/v1/datasets                 datasets with their dimensions, years and measures
+    /api/v1/<dataset>/dimensions     values of every dimension, years, measures and municipalities
+    /api/v1/<dataset>/map            one measure for every municipality in one year
+    /api/v1/<dataset>/series         one measure over the years for some municipalities
+Lookups go through the dimension index of the loaded dataset (cube.DataCube).
+Rows are sent as arrays in the order of 'columns'. fields=a,b keeps only some
+columns, and limit/offset page through the rows ('next' is the URL of the next
+page). Unknown parameters are rejected with 400. Responses are cached like the
+downloads (ETag from dataset + query).
+"""
+import gzip
+import json
+import urllib.parse
+import numpy as np
+import flask
+from werkzeug.http import http_date, quote_etag
+
+from ineq_app import app
+from data import DATASETS, get_cube, get_modified
+from downloads import DOWNLOAD_MAX_AGE, accepts_gzip, download_etag, not_modified
+
+API_PREFIX = '/api/v1'
+COLUMNS = ['KOMKODE', 'municipality', 'year', 'value', 'observations']
+TABLE_PARAMS = {'fields', 'limit', 'offset'}
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+api = flask.Blueprint('api', __name__, url_prefix=API_PREFIX)
+
+class ApiError(Exception):
+    """
+    Bad request to the API, sent as {"error": message} with status.
+    """
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+@api.errorhandler(ApiError)
+def api_error(error):
+    return flask.Response(json.dumps({'error': error.message}, ensure_ascii=False), status=error.status, mimetype='application/json')
+
+def _send_json(payload: dict, dataset: str = None):
+    """
+    Returns JSON response, gzipped for clients that accept it. Responses for a
+    dataset get its caching headers and 304 for conditional requests.
+    """
+    gzipped = accepts_gzip()
+    headers = {'Vary': 'Accept-Encoding'}
+    if dataset is not None:
+        etag = download_etag(dataset) + ('-gzip' if gzipped else '')
+        modified = get_modified(dataset)
+        headers.update({'Cache-Control': f'public, max-age={DOWNLOAD_MAX_AGE}', 'ETag': quote_etag(etag), 'Last-Modified': http_date(modified)})
+        if not_modified(etag, modified):
+            return flask.Response(status=304, headers=headers)
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if gzipped:
+        body = gzip.compress(body, 6)
+        headers['Content-Encoding'] = 'gzip'
+    return flask.Response(body, mimetype='application/json', headers=headers)
+
+def _cube(dataset: str):
+    if dataset not in DATASETS:
+        raise ApiError(f'unknown dataset: {dataset}', 404)
+    return get_cube(dataset)
+
+def _check_params(allowed: set):
+    """
+    Raises ApiError for query parameters the endpoint does not know, so a
+    misspelled filter is not answered with the unfiltered data (as /export).
+    """
+    unknown = set(flask.request.args) - set(allowed)
+    if unknown:
+        raise ApiError(f'unknown parameters: {", ".join(sorted(unknown))}')
+
+def _selection(cube) -> dict:
+    """
+    Returns the dimension values of the request. A dimension that is not given
+    is 'all' if it has that value.
+    """
+    selection = {}
+    for dim in cube.dims:
+        value = flask.request.args.get(dim, 'all' if 'all' in cube.values[dim] else None)
+        if value is None:
+            raise ApiError(f'missing dimension: {dim}')
+        if value not in cube.values[dim]:
+            raise ApiError(f'unknown value of {dim}: {value}')
+        selection[dim] = value
+    return selection
+
+def _measure(cube) -> str:
+    measure = flask.request.args.get('measure')
+    if measure not in cube.measures:
+        raise ApiError(f'unknown measure: {measure}')
+    return measure
+
+def _int_args(name: str) -> list:
+    try:
+        return [int(v) for v in flask.request.args.getlist(name)]
+    except ValueError:
+        raise ApiError(f'{name} must be an integer')
+
+def _int_arg(name: str, default: int) -> int:
+    values = _int_args(name)
+    if len(values) > 1:
+        raise ApiError(f'{name} must be given once')
+    return values[0] if values else default
+
+def _table(columns: dict) -> dict:
+    """
+    Returns the requested page of rows and fields of a table.
+    Args:
+        columns: column name (COLUMNS) -> numpy array, all of the same length
+    """
+    fields = [f for value in flask.request.args.getlist('fields') for f in value.split(',') if f] or COLUMNS
+    unknown = [f for f in fields if f not in columns]
+    if unknown:
+        raise ApiError(f'unknown fields: {", ".join(unknown)}')
+    limit = _int_arg('limit', DEFAULT_LIMIT)
+    offset = _int_arg('offset', 0)
+    if not 0 < limit <= MAX_LIMIT or offset < 0:
+        raise ApiError(f'limit must be 1-{MAX_LIMIT} and offset not negative')
+    total = len(columns[COLUMNS[0]])
+    page = [columns[f][offset:offset + limit] for f in fields]
+    page = [[None if v != v else v for v in values.tolist()] for values in page] # NaN -> null
+    next_url = None
+    if offset + limit < total:
+        args = [(k, v) for k, v in flask.request.args.items(multi=True) if k != 'offset'] + [('offset', offset + limit)]
+        next_url = flask.request.path + '?' + urllib.parse.urlencode(args)
+    return {'columns': fields, 'rows': [list(row) for row in zip(*page)], 'total': total, 'offset': offset, 'limit': limit, 'next': next_url}
+
+@api.route('/datasets')
+def datasets():
+    _check_params(set())
+    listing = []
+    for name in DATASETS:
+        cube = get_cube(name)
+        listing.append({'name': name, 'dimensions': cube.dims, 'years': cube.years, 'measures': cube.measures})
+    return _send_json({'datasets': listing})
+
+@api.route('/<dataset>/dimensions')
+def dimensions(dataset):
+    cube = _cube(dataset)
+    _check_params(set())
+    return _send_json({
+        'dataset': dataset,
+        'dimensions': cube.values,
+        'years': cube.years,
+        'measures': cube.measures,
+        'municipalities': {'columns': ['KOMKODE', 'municipality'], 'rows': [[int(k), str(n)] for k, n in zip(cube.komkoder, cube.names)]},
+    }, dataset)
+
+@api.route('/<dataset>/map')
+def map_slice(dataset):
+    """
+    Municipalities with a value of measure in year, e.g.
+    /api/v1/income/map?variable=aekvivadisp&measure=Gini&year=2018
+    """
+    cube = _cube(dataset)
+    _check_params(set(cube.dims) | {'measure', 'year'} | TABLE_PARAMS)
+    selection, measure = _selection(cube), _measure(cube)
+    years = _int_args('year')
+    if len(years) != 1 or years[0] not in cube.years:
+        raise ApiError(f'year must be one of {cube.years}')
+    y = cube.years.index(years[0])
+    values = cube.grid(measure, **selection)[y]
+    valid = ~np.isnan(values)
+    columns = {
+        'KOMKODE': cube.komkoder[valid].astype('int64'),
+        'municipality': cube.names[valid],
+        'year': np.full(valid.sum(), years[0]),
+        'value': values[valid],
+        'observations': cube.grid('observations', **selection)[y][valid],
+    }
+    return _send_json(dict(dataset=dataset, measure=measure, selection=selection, **_table(columns)), dataset)
+
+@api.route('/<dataset>/series')
+def series(dataset):
+    """
+    Years with a value of measure, for every municipality in KOMKODE (repeated,
+    default all; 0 is Hele Danmark), sorted by KOMKODE and year, e.g.
+    /api/v1/income/series?variable=aekvivadisp&measure=Gini&KOMKODE=0&KOMKODE=101
+    """
+    cube = _cube(dataset)
+    _check_params(set(cube.dims) | {'measure', 'KOMKODE'} | TABLE_PARAMS)
+    selection, measure = _selection(cube), _measure(cube)
+    komkoder = _int_args('KOMKODE')
+    positions = np.flatnonzero(np.isin(cube.komkoder, komkoder)) if komkoder else np.arange(len(cube.komkoder))
+    values = cube.grid(measure, **selection)[:, positions].T # (KOMKODE, year)
+    valid = ~np.isnan(values)
+    kom, year = np.nonzero(valid)
+    columns = {
+        'KOMKODE': cube.komkoder[positions][kom].astype('int64'),
+        'municipality': cube.names[positions][kom],
+        'year': np.asarray(cube.years)[year],
+        'value': values[valid],
+        'observations': cube.grid('observations', **selection)[:, positions].T[valid],
+    }
+    return _send_json(dict(dataset=dataset, measure=measure, selection=selection, **_table(columns)), dataset)
+
+app.server.register_blueprint(api)
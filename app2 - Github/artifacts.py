@@ -0,0 +1,147 @@
+"""
+Store of exported files (PNG, SVG, ZIP, ...) served by short content hash.
+The image download routes take the selectors, build the file once, put it here and
+redirect to ARTIFACT_ROUTE. The file is then served by its ID with caching
+headers, so repeated downloads do not rebuild it, and nothing large travels in
+a URL. Files live on the local filesystem, shared by all workers on a machine,
+and expire ARTIFACT_TTL seconds after they were last stored.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import flask
+from werkzeug.http import quote_etag
+
+from ineq_app import app
+
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', os.path.join(tempfile.gettempdir(), 'ulighedsapp-artifacts'))
+ARTIFACT_TTL = int(os.environ.get('ARTIFACT_TTL', 3600)) # seconds
+ARTIFACT_SWEEP_SECONDS = 60
+ARTIFACT_ROUTE = '/artifacts/<artifact_id>'
+ID_LENGTH = 16 # hex digits of the sha256 used as ID
+
+logger = logging.getLogger(__name__)
+
+class ArtifactStore:
+    """
+    Files by ID on disk. The ID is a hash of the content, the mimetype and the
+    download name, so the same export always gets the same ID. Written
+    atomically (temp file + rename); a background thread deletes expired files.
+    Args:
+        directory: store directory
+        ttl: seconds a file is kept after it was last put
+    """
+    def __init__(self, directory: str = ARTIFACT_DIR, ttl: int = ARTIFACT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        thread = threading.Thread(target=self._sweep_forever, daemon=True)
+        thread.start()
+
+    def _path(self, artifact_id: str) -> str:
+        return os.path.join(self.directory, artifact_id)
+
+    def put(self, data: bytes, mimetype: str, filename: str) -> str:
+        """
+        Stores a file (or renews it if it is already stored) and returns its ID.
+        Args:
+            data: file content
+            mimetype: e.g. 'image/png'
+            filename: name of the download, e.g. 'RFF-kort.png'
+        """
+        meta = json.dumps({'mimetype': mimetype, 'filename': filename}).encode('utf-8')
+        artifact_id = hashlib.sha256(meta + b'\0' + data).hexdigest()[:ID_LENGTH]
+        path = self._path(artifact_id)
+        try:
+            os.utime(path + '.json')
+            os.utime(path)
+            return artifact_id
+        except OSError:
+            pass # not stored yet (or just expired)
+        for suffix, content in (('.json', meta), ('', data)): # content last: it marks the artifact as complete
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, path + suffix)
+        return artifact_id
+
+    def get(self, artifact_id: str):
+        """
+        Returns (data, meta, expires) for an ID, or None if unknown or expired.
+        meta is {'mimetype', 'filename'} and expires the unix time it expires.
+        """
+        if len(artifact_id) != ID_LENGTH or not all(c in '0123456789abcdef' for c in artifact_id):
+            return None
+        path = self._path(artifact_id)
+        try:
+            expires = os.path.getmtime(path) + self.ttl
+            if expires < time.time():
+                return None
+            with open(path + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        return data, meta, expires
+
+    def sweep(self):
+        """
+        Deletes expired files and temp files left behind by killed workers.
+        """
+        now = time.time()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    if now - entry.stat().st_mtime > self.ttl:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass # removed by another worker
+                except OSError:
+                    logger.warning('could not remove %s', entry.path, exc_info=True)
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(ARTIFACT_SWEEP_SECONDS)
+            try:
+                self.sweep()
+            except OSError:
+                logger.exception('sweep of %s failed', self.directory) # try again next time, the thread must not die
+
+store = ArtifactStore()
+
+def artifact_url(artifact_id: str) -> str:
+    return ARTIFACT_ROUTE.replace('<artifact_id>', artifact_id)
+
+def send_artifact(data: bytes, mimetype: str, filename: str):
+    """
+    Returns redirect (303) to a file put in the store, for the image download routes.
+    Args:
+        data: file content
+        mimetype: e.g. 'image/png'
+        filename: name of the download, e.g. 'RFF-kort.png'
+    """
+    return flask.redirect(artifact_url(store.put(data, mimetype, filename)), code=303)
+
+@app.server.route(ARTIFACT_ROUTE)
+def serve_artifact(artifact_id):
+    """
+    Serves a stored file as download. The content of an ID never changes, so it
+    can be cached until it expires.
+    """
+    artifact = store.get(artifact_id)
+    if artifact is None:
+        flask.abort(404)
+    data, meta, expires = artifact
+    headers = {
+        'Cache-Control': f'private, max-age={max(int(expires - time.time()), 0)}, immutable',
+        'ETag': quote_etag(artifact_id),
+        'Content-Disposition': f'attachment; filename={meta["filename"]}',
+    }
+    if flask.request.if_none_match.contains_weak(artifact_id):
+        return flask.Response(status=304, headers=headers)
+    return flask.Response(data, mimetype=meta['mimetype'], headers=headers)
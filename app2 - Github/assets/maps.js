@@ -0,0 +1,188 @@
+/*
+ * Clientside recoloring of the choropleth maps.
+ * The server sends a small payload per selection (maps.map_payload in Python):
+ * rows of [KOMKODE, value, observations...] and the texts. The base figures,
+ * the municipality names and the missing trace come once per page (maps.map_base).
+ * Keep in sync with maps.map_figure, which builds the same figure on the server.
+ */
+
+// Returns GeoJSON FeatureCollection from the TopoJSON written by geometry.encode_topojson
+// (quantized, delta encoded arcs). Same decoding as geometry.decode_topojson.
+function decodeTopology(topology) {
+    var scale = topology.transform.scale;
+    var translate = topology.transform.translate;
+    var arcs = topology.arcs.map(function(arc) {
+        var x = 0, y = 0;
+        return arc.map(function(p) {
+            x += p[0];
+            y += p[1];
+            return [x * scale[0] + translate[0], y * scale[1] + translate[1]];
+        });
+    });
+    function ring(refs) {
+        var points = [];
+        refs.forEach(function(ref) {
+            var arc = ref >= 0 ? arcs[ref] : arcs[~ref].slice().reverse();
+            points.push.apply(points, points.length ? arc.slice(1) : arc);
+        });
+        return points;
+    }
+    function polygon(rings) { return rings.map(ring); }
+    return {
+        type: 'FeatureCollection',
+        features: topology.objects.kommuner.geometries.map(function(g) {
+            return {
+                type: 'Feature',
+                properties: g.properties,
+                geometry: {
+                    type: g.type,
+                    coordinates: g.type === 'Polygon' ? polygon(g.arcs) : g.arcs.map(polygon)
+                }
+            };
+        })
+    };
+}
+
+// The traces reference the geometry by its GeoJSON URL. Plotly keeps fetched
+// geometry in window.PlotlyGeoAssets by URL and waits while an entry is 'pending',
+// so the TopoJSON is fetched instead, once per page load, and its decoding put
+// under the GeoJSON URL. If that fails, the GeoJSON itself is fetched.
+function preloadGeometry(base) {
+    var url = base.level.data[0].geojson;
+    if (!base.topojson || typeof url !== 'string') {
+        return;
+    }
+    var assets = window.PlotlyGeoAssets = window.PlotlyGeoAssets || {topojson: {}};
+    if (assets[url]) {
+        return;
+    }
+    assets[url] = 'pending';
+    function get(u) {
+        return fetch(u).then(function(r) {
+            if (!r.ok) {
+                throw new Error('Unexpected error while fetching from ' + u);
+            }
+            return r.json();
+        });
+    }
+    get(base.topojson).then(decodeTopology).catch(function() {
+        return get(url);
+    }).then(function(geojson) {
+        assets[url] = geojson;
+    }).catch(function() {
+        delete assets[url]; // tried again on the next map
+    });
+}
+
+// KOMKODE -> {lon, lat} with the exterior ring of every polygon of the municipality,
+// separated by null, precomputed on the server (geometry.exterior_rings). base.outlines
+// is its URL (fetched once per page load, cached by the browser) or the index itself.
+var outlineIndexes = {};
+function preloadOutlines(base) {
+    var source = base.outlines;
+    if (!source || typeof source !== 'string') {
+        return;
+    }
+    if (outlineIndexes[source]) {
+        return;
+    }
+    outlineIndexes[source] = 'pending';
+    fetch(source).then(function(r) {
+        if (!r.ok) {
+            throw new Error('Unexpected error while fetching from ' + source);
+        }
+        return r.json();
+    }).then(function(index) {
+        outlineIndexes[source] = index;
+    }).catch(function() {
+        delete outlineIndexes[source]; // tried again on the next map
+    });
+}
+
+// Returns the outline trace (last trace of the base figure, see maps.outline_trace)
+// for the hovered municipality, or the empty one.
+function outlineTrace(template, hoverData, base) {
+    var empty = template.data[template.data.length - 1];
+    var point = hoverData && hoverData.points && hoverData.points[0];
+    if (!point || point.location === undefined) {
+        return empty;
+    }
+    var index = typeof base.outlines === 'string' ? outlineIndexes[base.outlines] : base.outlines;
+    if (!index || typeof index !== 'object') {
+        return empty; // index still loading
+    }
+    var outline = index[point.location];
+    return outline ? Object.assign({}, empty, outline) : empty;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    maps: {
+        // Inputs: the map payload and the hover data of the map. On hover only the
+        // outline trace of the current figure is replaced, without a server request.
+        recolor: function(payload, hoverData, base, figure) {
+            if (!payload || !base) {
+                return window.dash_clientside.no_update;
+            }
+            preloadGeometry(base);
+            preloadOutlines(base);
+            var template = payload.diverging ? base.diverging : base.level;
+            var context = window.dash_clientside.callback_context;
+            var hovered = context && context.triggered.length && context.triggered.every(function(t) {
+                return /\.hoverData$/.test(t.prop_id);
+            });
+            if (hovered && figure && figure.data) {
+                return Object.assign({}, figure, {
+                    data: figure.data.slice(0, -1).concat([outlineTrace(template, hoverData, base)])
+                });
+            }
+
+            var names = {};
+            base.names.forEach(function(n) { names[n[0]] = n[1]; });
+
+            var present = {};
+            var locations = [];
+            var z = [];
+            var customdata = [];
+            payload.rows.forEach(function(row) {
+                present[row[0]] = true;
+                locations.push(row[0]);
+                z.push(row[1]);
+                customdata.push([names[row[0]] || ''].concat(row.slice(1)));
+            });
+            var trace = Object.assign({}, template.data[0], {
+                locations: locations,
+                z: z,
+                customdata: customdata,
+                hovertemplate: payload.hovertemplate
+            });
+
+            var coloraxis = Object.assign({}, template.layout.coloraxis);
+            coloraxis.colorbar = Object.assign({}, coloraxis.colorbar, {
+                title: {text: payload.colorbar_title},
+                tickformat: payload.tickformat
+            });
+            if (!payload.diverging) {
+                coloraxis.cmin = z.length ? Math.min.apply(null, z) : null;
+                coloraxis.cmax = z.length ? Math.max.apply(null, z) : null;
+            }
+            var layout = Object.assign({}, template.layout, {
+                coloraxis: coloraxis,
+                annotations: [Object.assign({}, template.layout.annotations[0], {text: payload.annotation})]
+            });
+
+            var data = [trace];
+            // 0 is Hele Danmark, which is not on the map
+            var missing = base.names.filter(function(n) { return n[0] !== 0 && !present[n[0]]; });
+            if (missing.length > 0) {
+                data.push(Object.assign({}, base.missing, {
+                    locations: missing.map(function(n) { return n[0]; }),
+                    z: missing.map(function() { return 1; }),
+                    customdata: missing.map(function(n) { return [n[1], 'missing']; })
+                }));
+            }
+            // Bornholm square, then the outline on top
+            data = data.concat(template.data.slice(1, -1), [outlineTrace(template, hoverData, base)]);
+            return {data: data, layout: layout};
+        }
+    }
+});
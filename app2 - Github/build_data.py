@@ -0,0 +1,18 @@
+"""
+Offline build step: converts the csv datasets in files/ to the binary columnar
+format read by data.py (files/<dataset>.cols). Run after updating a csv:
+
+    python build_data.py            # all datasets
+    python build_data.py income     # only income
+"""
+import sys
+import time
+
+from data import DATASETS, write_columns, columns_dir
+
+if __name__ == "__main__":
+    datasets = sys.argv[1:] or list(DATASETS)
+    for dataset in datasets:
+        start = time.time()
+        write_columns(dataset)
+        print(f'{dataset}: wrote {columns_dir(dataset)} ({time.time() - start:.1f}s)')
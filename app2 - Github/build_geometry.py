@@ -0,0 +1,33 @@
+"""
+Offline build step: writes the simplified levels of the municipality geometry
+(files/kommuner.<level>.topojson, see geometry.LEVELS) read by data.py.
+Run after updating kommuner.topojson:
+
+    python build_geometry.py            # all levels
+    python build_geometry.py screen     # only screen
+
+A new geometry from GeoJSON (FeatureCollection with properties.KOMKODE) is
+encoded as kommuner.topojson first with:
+
+    python build_geometry.py --source kommuner.geojson
+"""
+import os
+import sys
+import time
+
+from geometry import LEVELS, count_points
+from data import GEOMETRY, get_geojson, write_source, write_geometry, geometry_path
+from utils import path2file
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ['--source']:
+        write_source(args[1])
+        print(f'wrote {path2file(GEOMETRY)} from {args[1]}')
+        args = args[2:]
+    levels = args or list(LEVELS)
+    print(f'{GEOMETRY}: {count_points(get_geojson())} points, {os.path.getsize(path2file(GEOMETRY))} bytes')
+    for level in levels:
+        start = time.time()
+        write_geometry(level)
+        print(f'{level}: wrote {geometry_path(level)}, {count_points(get_geojson(level))} points, {os.path.getsize(geometry_path(level))} bytes ({time.time() - start:.1f}s)')
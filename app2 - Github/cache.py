@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import functools
+from collections import OrderedDict
+import plotly
+
+FIGURE_CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', 256)) # entries per cache
+FIGURE_CACHE_DIR = os.environ.get('FIGURE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ulighedsapp-figures'))
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get('FIGURE_CACHE_MAX_BYTES', 256 * 2**20)) # whole directory
+FIGURE_CACHE_SWEEP_SECONDS = 60
+CACHE_VERSION = 2 # bump when the cached figures change meaning; code changes are caught by code_hash too
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+class FigureCache:
+    """
+    Bounded in-process LRU cache of finished figure dicts, keyed by the selector
+    tuple of the callback. Thread safe.
+    Args:
+        maxsize: max number of figures kept. Least recently used are evicted first
+        disk: optional DiskCache used as second level, shared by all workers
+    """
+    def __init__(self, maxsize: int = FIGURE_CACHE_SIZE, disk=None):
+        self.maxsize = maxsize
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns cached figure for key or None.
+        """
+        with self._lock:
+            fig = self._figures.get(key)
+            if fig is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._figures.move_to_end(key)
+            return fig
+
+    def put(self, key, fig) -> dict:
+        """
+        Stores figure (go.Figure or dict) and returns it as dict.
+        """
+        if hasattr(fig, 'to_dict'):
+            fig = fig.to_dict()
+        with self._lock:
+            self._figures[key] = fig
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+                self.evictions += 1
+        return fig
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and current size.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._figures), 'maxsize': self.maxsize}
+
+    def memoize(self, func):
+        """
+        Decorator for callbacks with scalar selector values as arguments.
+        The values are compared as strings, so 2018 and '2018' share an entry.
+        """
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = tuple(str(a) for a in args)
+            fig = self.get(key)
+            if fig is None and self.disk is not None:
+                fig = self.disk.get(key)
+                if fig is not None:
+                    fig = self.put(key, fig)
+            if fig is None:
+                fig = self.put(key, func(*args))
+                if self.disk is not None:
+                    self.disk.put(key, fig)
+            return fig
+        wrapper.cache = self
+        return wrapper
+
+class DiskCache:
+    """
+    Figure JSON on the local filesystem, shared by all workers on a machine.
+    Entries are content addressed: the file name is a hash of the namespace,
+    the dataset hash, the app source (code_hash) and the selector tuple, so a
+    new dataset or new figure code never hits old entries. Files are written atomically (temp file + rename). A background
+    thread deletes the least recently used files when the directory grows
+    beyond max_bytes.
+    Args:
+        namespace: e.g. 'income-map'
+        version: content hash of the dataset behind the figures
+        directory: cache directory
+        max_bytes: size limit of the directory
+    """
+    def __init__(self, namespace: str, version: str, directory: str = FIGURE_CACHE_DIR, max_bytes: int = FIGURE_CACHE_MAX_BYTES):
+        self.namespace = namespace
+        self.version = version
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.code = code_hash()
+        os.makedirs(directory, exist_ok=True)
+        _start_sweeper(directory, max_bytes)
+
+    def _path(self, key: tuple) -> str:
+        name = hashlib.sha256(json.dumps([CACHE_VERSION, self.code, self.namespace, self.version, list(key)]).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.json')
+
+    def get(self, key: tuple):
+        """
+        Returns figure dict for key or None.
+        """
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                fig = json.load(f)
+            os.utime(path) # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return fig
+
+    def put(self, key: tuple, fig: dict):
+        """
+        Writes figure dict for key.
+        """
+        text = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+@functools.lru_cache(maxsize=None)
+def code_hash() -> str:
+    """
+    Returns sha256 of the Python source of the app (*.py here and in pages/).
+    Part of the disk cache keys, so a deploy that changes how figures are built
+    never serves figures written by the old code.
+    """
+    sha = hashlib.sha256()
+    for folder in (APP_DIR, os.path.join(APP_DIR, 'pages')):
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.py'):
+                with open(os.path.join(folder, name), 'rb') as f:
+                    sha.update(name.encode('utf-8') + b'\0' + f.read() + b'\0')
+    return sha.hexdigest()
+
+_sweepers = {} # directory -> thread
+
+def _start_sweeper(directory: str, max_bytes: int):
+    """
+    Starts (once per directory and process) a daemon thread evicting least recently used files.
+    """
+    if directory in _sweepers:
+        return
+    thread = threading.Thread(target=_sweep_forever, args=(directory, max_bytes), daemon=True)
+    _sweepers[directory] = thread
+    thread.start()
+
+def _sweep_forever(directory: str, max_bytes: int):
+    while True:
+        time.sleep(FIGURE_CACHE_SWEEP_SECONDS)
+        try:
+            sweep(directory, max_bytes)
+        except OSError:
+            logger.exception('sweep of %s failed', directory) # try again next time, the thread must not die
+
+def sweep(directory: str, max_bytes: int):
+    """
+    Deletes the least recently used cache files until directory is below max_bytes.
+    """
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if entry.name.endswith('.tmp') and time.time() - stat.st_mtime > 3600:
+                try:
+                    os.remove(entry.path) # left behind by a killed worker
+                except FileNotFoundError:
+                    pass # removed by another worker
+            elif entry.name.endswith('.json'):
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass # removed by another worker
+        except OSError:
+            logger.warning('could not remove %s', path, exc_info=True)
+        total -= size
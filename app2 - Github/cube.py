@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+
+class DataCube:
+    """
+    Dimensional index over one of the page datasets.
+    Rows are sorted once by the dimension columns, year and KOMKODE, so every
+    selector combination is a contiguous block of rows. Lookups are a dict
+    lookup plus a positional slice, i.e. no boolean masks over the full table.
+    Args:
+        df: dataset as read from csv, e.g. income.csv
+        dims: dimension columns (besides year), e.g. ['variable', 'gender', 'age']
+        presorted: df is already sorted by dims, year and KOMKODE (e.g. built by build_data.py)
+    """
+    def __init__(self, df: pd.DataFrame, dims: list, presorted: bool = False):
+        self.dims = list(dims)
+        if presorted:
+            self.df = df
+        else:
+            self.df = df.sort_values(by=self.dims + ['year', 'KOMKODE'], kind='mergesort').reset_index(drop=True)
+        self.years = [int(y) for y in sorted(self.df['year'].unique())]
+        self._slices = self._block_index(self.dims + ['year']) # (dims..., year) -> (start, stop)
+        self._series = self._block_index(self.dims) # (dims...) -> (start, stop), all years
+        self.values = {d: list(dict.fromkeys(key[i] for key in self._series)) for i, d in enumerate(self.dims)} # dim -> values with data, in sort order
+        self._build_grids()
+
+    def _block_index(self, cols: list) -> dict:
+        """
+        Returns dict with the group key as key and (start, stop) row positions as value.
+        Relies on self.df being sorted by cols.
+        """
+        sizes = self.df.groupby(cols, sort=False, observed=True).size()
+        stops = sizes.values.cumsum()
+        starts = stops - sizes.values
+        keys = [k if isinstance(k, tuple) else (k,) for k in sizes.index]
+        return dict(zip(keys, zip(starts, stops)))
+
+    def _build_grids(self):
+        """
+        Fills self._grids with one (group, year, KOMKODE) array per measure.
+        Observations are int64 with 0 where there is no row, the measures float64 with NaN.
+        """
+        kom = self.df['KOMKODE'].values
+        self.komkoder, first = np.unique(kom, return_index=True) # grid columns, sorted
+        self.names = np.asarray(self.df['municipality'])[first] # municipality name per column
+        self._kom_pos = {int(k): i for i, k in enumerate(self.komkoder)}
+        self._name_pos = {str(n): i for i, n in enumerate(self.names)}
+        self._year_pos = {y: i for i, y in enumerate(self.years)}
+        self._groups = {key: i for i, key in enumerate(self._series)} # (dims...) -> grid index
+        sizes = [stop - start for start, stop in self._series.values()]
+        group_idx = np.repeat(np.arange(len(sizes)), sizes)
+        year_idx = np.searchsorted(self.years, self.df['year'].values)
+        kom_idx = np.searchsorted(self.komkoder, kom)
+        shape = (len(sizes), len(self.years), len(self.komkoder))
+        self.measures = [c for c in self.df.columns if self.df[c].dtype == 'float64']
+        self._grids = {}
+        for measure in self.measures + ['observations']:
+            if measure == 'observations':
+                grid = np.zeros(shape, dtype='int64')
+            else:
+                grid = np.full(shape, np.nan)
+            grid[group_idx, year_idx, kom_idx] = self.df[measure].values
+            grid.flags.writeable = False
+            self._grids[measure] = grid
+
+    def _key(self, selection: dict) -> tuple:
+        return tuple(selection[d] for d in self.dims)
+
+    def select(self, year=None, KOMKODE=None, municipality=None, **selection) -> pd.DataFrame:
+        """
+        Returns the rows for a selection. The result is a slice of the sorted
+        frame (sorted by year and KOMKODE), not a copy.
+        Args:
+            year: year for a single map slice. If None all years are returned (time series)
+            KOMKODE: optional, only keep rows for this municipality code
+            municipality: optional, only keep rows for this municipality name
+            selection: value for every dimension, e.g. variable='Gini', gender='all'
+        """
+        key = self._key(selection)
+        if year is None:
+            start, stop = self._series.get(key, (0, 0))
+        else:
+            start, stop = self._slices.get(key + (int(year),), (0, 0))
+        dfs = self.df.iloc[start:stop]
+        if KOMKODE is not None:
+            dfs = dfs[dfs['KOMKODE'] == KOMKODE]
+        if municipality is not None:
+            dfs = dfs[dfs['municipality'] == municipality]
+        return dfs
+
+    def rows(self, years=None, komkoder=None, **predicates) -> np.ndarray:
+        """
+        Returns sorted positions (in self.df) of the rows matching every predicate,
+        for bulk exports. Blocks of matching dimension values are found in the
+        index, so only their rows are checked for year and KOMKODE.
+        Args:
+            years: optional collection of years, e.g. [2017, 2018]
+            komkoder: optional collection of municipality codes, 0 is Hele Danmark
+            predicates: optional collection of values for a dimension, e.g.
+                gender=['all', 'woman']. Dimensions not given match every value.
+        """
+        blocks = [np.arange(start, stop) for key, (start, stop) in self._series.items()
+                  if all(key[i] in predicates[d] for i, d in enumerate(self.dims) if d in predicates)]
+        rows = np.concatenate(blocks) if blocks else np.zeros(0, dtype='int64')
+        if years is not None:
+            rows = rows[np.isin(self.df['year'].values[rows], list(years))]
+        if komkoder is not None:
+            rows = rows[np.isin(self.df['KOMKODE'].values[rows], list(komkoder))]
+        return rows
+
+    def grid(self, measure: str, **selection) -> np.ndarray:
+        """
+        Returns read-only (year, KOMKODE) array of a measure for a selection.
+        Rows follow self.years and columns self.komkoder.
+        Args:
+            measure: e.g. 'Gini' or 'observations'
+            selection: value for every dimension, e.g. variable='Gini', gender='all'
+        """
+        grid = self._grids[measure]
+        group = self._groups.get(self._key(selection))
+        if group is None:
+            return np.zeros(grid.shape[1:], dtype=grid.dtype) if measure == 'observations' else np.full(grid.shape[1:], np.nan)
+        return grid[group]
+
+    def series(self, KOMKODE=None, municipality=None, **selection) -> dict:
+        """
+        Returns dict with every measure (and observations) as array over self.years
+        for one municipality. Years without data are NaN (0 observations).
+        Args:
+            KOMKODE: municipality code, 0 is Hele Danmark
+            municipality: municipality name, used if KOMKODE is None
+            selection: value for every dimension, e.g. variable='Gini', gender='all'
+        """
+        pos = self._kom_pos.get(KOMKODE) if KOMKODE is not None else self._name_pos.get(municipality)
+        series = {}
+        for measure in self._grids:
+            grid = self.grid(measure, **selection)
+            if pos is None:
+                series[measure] = np.zeros(len(self.years), dtype=grid.dtype) if measure == 'observations' else np.full(len(self.years), np.nan)
+            else:
+                series[measure] = grid[:, pos]
+        return series
+
+    def map(self, measure: str, year, **selection) -> pd.DataFrame:
+        """
+        Returns KOMKODE, municipality, measure and observations for the
+        municipalities with a value of measure in year.
+        Args:
+            measure: e.g. 'Gini'
+            year: year of the map
+            selection: value for every dimension, e.g. variable='Gini', gender='all'
+        """
+        y = self._year_pos.get(int(year))
+        if y is None:
+            valid = np.zeros(len(self.komkoder), dtype=bool)
+            values = observations = np.full(len(self.komkoder), np.nan)
+        else:
+            values = self.grid(measure, **selection)[y]
+            observations = self.grid('observations', **selection)[y]
+            valid = ~np.isnan(values)
+        return pd.DataFrame({
+            'KOMKODE': self.komkoder[valid],
+            'municipality': self.names[valid],
+            measure: values[valid],
+            'observations': observations[valid],
+        })
+
+    def _group_grid(self, measure: str, dim: str, groups, selection: dict) -> np.ndarray:
+        """
+        Returns (group, year, KOMKODE) array of measure with one entry per value of dim in groups.
+        """
+        grid = self._grids[measure]
+        index = [self._groups.get(self._key(dict(selection, **{dim: g}))) for g in groups]
+        if None not in index:
+            return grid[index]
+        missing = np.zeros(grid.shape[1:], dtype=grid.dtype) if measure == 'observations' else np.full(grid.shape[1:], np.nan)
+        return np.stack([missing if i is None else grid[i] for i in index])
+
+    def pair(self, dim: str, groups, year, komkoder, measure: str = 'observations', **selection) -> np.ndarray:
+        """
+        Returns (len(groups), len(komkoder)) array of measure in year for each
+        value of dim in groups, aligned with komkoder (e.g. the KOMKODE column of
+        a map). Codes without data give 0 observations (NaN for other measures).
+        Args:
+            dim: dimension the groups differ in, e.g. 'gender'
+            groups: values of dim, e.g. ('woman', 'man')
+            year: year of the map
+            komkoder: sequence of municipality codes
+            measure: e.g. 'observations'
+            selection: value for every other dimension, e.g. variable='Gini', age='all'
+        """
+        grid = self._group_grid(measure, dim, groups, selection)
+        missing = 0 if measure == 'observations' else np.nan
+        codes = np.asarray(komkoder)
+        y = self._year_pos.get(int(year))
+        if y is None or len(codes) == 0:
+            return np.full((len(groups), len(codes)), missing, dtype=grid.dtype)
+        pos = np.searchsorted(self.komkoder, codes).clip(max=len(self.komkoder) - 1)
+        values = grid[:, y, pos]
+        values[:, self.komkoder[pos] != codes] = missing
+        return values
+
+    def pair_series(self, dim: str, groups, KOMKODE=None, municipality=None, measure: str = 'observations', **selection) -> np.ndarray:
+        """
+        Returns (len(groups), len(self.years)) array of measure for one
+        municipality and each value of dim in groups.
+        Args:
+            dim: dimension the groups differ in, e.g. 'gender'
+            groups: values of dim, e.g. ('woman', 'man')
+            KOMKODE: municipality code, 0 is Hele Danmark
+            municipality: municipality name, used if KOMKODE is None
+            measure: e.g. 'observations'
+            selection: value for every other dimension, e.g. variable='Gini', age='all'
+        """
+        grid = self._group_grid(measure, dim, groups, selection)
+        pos = self._kom_pos.get(KOMKODE) if KOMKODE is not None else self._name_pos.get(municipality)
+        if pos is None:
+            return np.full((len(groups), len(self.years)), 0 if measure == 'observations' else np.nan, dtype=grid.dtype)
+        return grid[:, :, pos]
@@ -0,0 +1,318 @@
+"""
+Shared data access for the pages.
+Every artifact (geometry, municipality codes, datasets) is loaded once per
+process and the same objects are handed to every page, so a worker holds a
+single copy of each. The returned objects are shared: treat them as read-only.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import threading
+from functools import lru_cache
+from types import MappingProxyType
+import numpy as np
+import pandas as pd
+
+from utils import path2file
+from cube import DataCube
+from geometry import LEVELS, LEVEL_QUANTIZATION, build_topology, simplify_topology, to_geojson, encode_topojson, decode_topojson, viewport
+
+# dimension columns (besides year) for each dataset
+DATASETS = {
+    'income': ['variable', 'gender', 'age', 'heritage', 'education', 'labor'],
+    'health': ['variable', 'gender', 'age', 'heritage', 'education', 'labor'],
+    'education': ['variable', 'gender', 'age', 'heritage'],
+}
+
+# fixed category order (labels_dict keys) of the dimension columns. Codes stay
+# the same across datasets and workers; unknown values get appended after these
+DIMENSION_VALUES = {
+    'variable': ['aekvivadisp', 'dispon', 'perindkialt', 'loenmv', 'admissions', 'nights', 'gp', 'copd', 't2diabetes', 'hfpria', 'labor', 'education'],
+    'gender': ['all', 'woman', 'man'],
+    'age': ['all', 'age1', 'age2', 'age3', 'age4', 'age5'],
+    'heritage': ['all', 'danish', 'nondanishnonwestern', 'nonwestern'],
+    'education': ['all', 'low', 'high'],
+    'labor': ['all', 'unskilled', 'skilled'],
+}
+
+GEOMETRY = 'kommuner.topojson' # municipality geometry, see geometry.py
+
+_topojsons = {} # level -> TopoJSON as loaded
+_geometries = {} # level -> geojson
+_load_lock = threading.RLock() # first requests on a threaded server load an artifact once, not once per thread
+
+def geometry_path(level: str) -> str:
+    """
+    Returns path of a simplified geometry level, e.g. files/kommuner.screen.topojson
+    """
+    return path2file(f'kommuner.{level}.topojson')
+
+def _write_json(obj, out: str):
+    with open(out + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(obj, f, separators=(',', ':'))
+    os.replace(out + '.tmp', out)
+
+def write_source(geojson_path: str):
+    """
+    Encodes a municipality geometry as the geometry artifact (files/kommuner.topojson):
+    shared borders stored once, coordinates quantized and delta encoded, and the
+    map view (geometry.viewport) as member 'viewport'.
+    Arg:
+        geojson_path: FeatureCollection with properties.KOMKODE, e.g. an export from DAGI
+    """
+    with open(geojson_path, encoding='utf-8') as geo:
+        geojson = json.load(geo)
+    topology = build_topology(geojson)
+    _write_json(dict(encode_topojson(topology), viewport=viewport(topology)), path2file(GEOMETRY))
+
+def write_geometry(level: str):
+    """
+    Writes a simplified level (see geometry.LEVELS) of the geometry artifact to
+    geometry_path(level). Shared borders are simplified once, so neighbours still fit.
+    Arg:
+        level: 'screen', 'png' or 'thumb'
+    """
+    _write_json(_simplified(level), geometry_path(level))
+
+def _simplified(level: str) -> dict:
+    source = get_topojson()
+    topojson = encode_topojson(simplify_topology(decode_topojson(source), LEVELS[level]), LEVEL_QUANTIZATION)
+    return dict(topojson, viewport=source['viewport']) # same view at every level
+
+def get_topojson(level: str = None) -> dict:
+    """
+    Returns the municipality geometry as TopoJSON (files/kommuner.topojson), or a
+    simplified level of it for a render target (see geometry.LEVELS). Levels are
+    read from the files written by build_geometry.py, or simplified on first
+    request if those are missing or older than the artifact.
+    Arg:
+        level: None for full detail, 'screen', 'png' or 'thumb'
+    """
+    if level not in _topojsons:
+        with _load_lock:
+            if level not in _topojsons:
+                source = path2file(GEOMETRY)
+                path = source if level is None else geometry_path(level)
+                if level is None or (os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source)):
+                    with open(path, encoding='utf-8') as geo:
+                        _topojsons[level] = json.load(geo)
+                else:
+                    _topojsons[level] = _simplified(level)
+    return _topojsons[level]
+
+def get_viewport() -> dict:
+    """
+    Returns the map view computed when the geometry artifact was built: center,
+    lon/lat ranges and the box around the Bornholm inset (see geometry.viewport).
+    """
+    return get_topojson()['viewport']
+
+def get_geojson(level: str = None) -> dict:
+    """
+    Returns the municipality geometry as GeoJSON FeatureCollection, decoded from get_topojson(level).
+    Arg:
+        level: None for full detail, 'screen', 'png' or 'thumb'
+    """
+    if level not in _geometries:
+        with _load_lock:
+            if level not in _geometries:
+                _geometries[level] = to_geojson(decode_topojson(get_topojson(level)))
+    return _geometries[level]
+
+@lru_cache(maxsize=None)
+def get_komkoder() -> tuple:
+    """
+    Returns read-only lookups (KOMKODE -> name, name -> KOMKODE) from kommune_koder.json.
+    """
+    with open(path2file('kommune_koder.json'), encoding='utf-8') as komk:
+        komkoder = json.load(komk)
+    komkoder2str = MappingProxyType({int(k): str(v) for k, v in komkoder.items()})
+    komstr2koder = MappingProxyType({str(v): int(k) for k, v in komkoder.items()})
+    return komkoder2str, komstr2koder
+
+def encode(df: pd.DataFrame, dims: list) -> pd.DataFrame:
+    """
+    Returns compact copy of a dataset. Dimension columns and municipality become
+    categoricals (small int codes) with categories from DIMENSION_VALUES and
+    komkoder2str, KOMKODE/year become int16 and the measures float64.
+    Args:
+        df: dataset as read from csv
+        dims: dimension columns, e.g. ['variable', 'gender', 'age']
+    """
+    komkoder2str, _ = get_komkoder()
+    fixed = dict(DIMENSION_VALUES, municipality=list(komkoder2str.values()))
+    columns = {}
+    for col in df.columns:
+        if col in dims or col == 'municipality':
+            categories = fixed.get(col, [])
+            extra = sorted(set(df[col].dropna().unique()) - set(categories))
+            columns[col] = pd.Categorical(df[col], categories=categories + extra)
+        elif col in ('KOMKODE', 'year'):
+            columns[col] = df[col].astype('int16')
+        elif col == 'observations':
+            columns[col] = df[col]
+        else:
+            columns[col] = df[col].astype('float64')
+    return pd.DataFrame(columns)
+
+_cubes = {} # dataset name -> DataCube
+_hashes = {} # dataset name -> content hash of the loaded data
+_modified = {} # dataset name -> modification time (unix) of the source csv
+
+def file_hash(path: str) -> str:
+    """
+    Returns sha256 hex digest of a file.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def columns_dir(dataset: str) -> str:
+    """
+    Returns path of the binary columnar version of a dataset, e.g. files/income.cols
+    """
+    return path2file(dataset + '.cols')
+
+def write_columns(dataset: str):
+    """
+    Converts files/<dataset>.csv to the binary columnar format (files/<dataset>.cols).
+    The rows are stored encoded and already sorted for DataCube. Every column is
+    a .npy file that can be memory-mapped: categoricals as their codes and all
+    float measures as one 2d array. meta.json holds the types, categories and the
+    hash of the source csv.
+    Arg:
+        dataset: name of dataset, e.g. 'income'
+    """
+    source = path2file(dataset + '.csv')
+    cube = DataCube(encode(pd.read_csv(source), DATASETS[dataset]), dims=DATASETS[dataset])
+    df = cube.df
+    out = columns_dir(dataset)
+    tmp = out + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    measures = [c for c in df.columns if df[c].dtype == 'float64']
+    meta = {
+        'rows': len(df),
+        'hash': file_hash(source),
+        'source_size': os.path.getsize(source),
+        'source_mtime': os.path.getmtime(source),
+        'columns': [],
+        'measures': measures,
+    }
+    for col in df.columns:
+        if col in measures:
+            continue
+        if df[col].dtype.name == 'category':
+            np.save(os.path.join(tmp, col + '.npy'), df[col].cat.codes.values)
+            meta['columns'].append({'name': col, 'dtype': 'category', 'categories': list(df[col].cat.categories)})
+        else:
+            np.save(os.path.join(tmp, col + '.npy'), df[col].values)
+            meta['columns'].append({'name': col, 'dtype': df[col].dtype.name})
+    np.save(os.path.join(tmp, 'measures.npy'), np.ascontiguousarray(df[measures].values.T)) # (measures, rows)
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    shutil.rmtree(out, ignore_errors=True)
+    os.rename(tmp, out)
+
+def read_columns(dataset: str):
+    """
+    Returns (DataFrame, hash, source mtime) for the binary columnar format, or None if it is missing
+    or older than the csv next to it. Columns are memory-mapped read-only, so
+    workers on the same machine share the pages.
+    Arg:
+        dataset: name of dataset, e.g. 'income'
+    """
+    folder = columns_dir(dataset)
+    try:
+        with open(os.path.join(folder, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    source = path2file(dataset + '.csv')
+    if os.path.exists(source) and (os.path.getsize(source) != meta['source_size'] or os.path.getmtime(source) != meta['source_mtime']):
+        return None # csv has changed since the build, fall back to it
+    columns = {}
+    for col in meta['columns']:
+        values = np.load(os.path.join(folder, col['name'] + '.npy'), mmap_mode='r')
+        if col['dtype'] == 'category':
+            values = pd.Categorical.from_codes(values, categories=col['categories'])
+        columns[col['name']] = values
+    measures = np.load(os.path.join(folder, 'measures.npy'), mmap_mode='r')
+    df = pd.concat([
+        pd.DataFrame(columns, copy=False),
+        pd.DataFrame(measures.T, columns=meta['measures'], copy=False),
+    ], axis=1, copy=False)
+    return df, meta['hash'], meta['source_mtime']
+
+def get_cube(dataset: str) -> DataCube:
+    """
+    Returns the indexed dataset. Loaded on first request from the binary columnar
+    format if it has been built (see build_data.py), otherwise from csv.
+    Arg:
+        dataset: name of dataset, e.g. 'income'
+    """
+    if dataset not in _cubes:
+        with _load_lock:
+            if dataset not in _cubes:
+                columns = read_columns(dataset)
+                if columns is not None:
+                    df, _hashes[dataset], _modified[dataset] = columns
+                    cube = DataCube(df, dims=DATASETS[dataset], presorted=True)
+                else:
+                    source = path2file(dataset + '.csv')
+                    _hashes[dataset] = file_hash(source)
+                    _modified[dataset] = os.path.getmtime(source)
+                    cube = DataCube(encode(pd.read_csv(source), DATASETS[dataset]), dims=DATASETS[dataset])
+                _cubes[dataset] = cube # last: other threads only see a finished cube
+    return _cubes[dataset]
+
+def get_hash(dataset: str) -> str:
+    """
+    Returns content hash (sha256 of the source csv) of a dataset.
+    Arg:
+        dataset: name of dataset, e.g. 'income'
+    """
+    get_cube(dataset)
+    return _hashes[dataset]
+
+def get_modified(dataset: str) -> float:
+    """
+    Returns modification time (unix) of the source csv of a dataset, as loaded.
+    Arg:
+        dataset: name of dataset, e.g. 'income'
+    """
+    get_cube(dataset)
+    return _modified[dataset]
+
+def _deep_sizeof(obj) -> int:
+    """
+    Returns approximate size in bytes of nested dicts/lists as loaded by json.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k) + _deep_sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, list):
+        size += sum(_deep_sizeof(v) for v in obj)
+    return size
+
+def memory_usage() -> dict:
+    """
+    Returns the approximate memory (bytes) held by each loaded artifact,
+    including the dense grids of the datasets (<dataset>-grids).
+    Artifacts that have not been loaded yet are not included.
+    """
+    usage = {}
+    for level, topojson in _topojsons.items():
+        usage['topojson' if level is None else f'topojson-{level}'] = _deep_sizeof(topojson)
+    for level, geojson in _geometries.items():
+        usage['geojson' if level is None else f'geojson-{level}'] = _deep_sizeof(geojson)
+    if get_komkoder.cache_info().currsize:
+        usage['komkoder'] = sum(_deep_sizeof(dict(d)) for d in get_komkoder())
+    for dataset, cube in list(_cubes.items()):
+        usage[dataset] = int(cube.df.memory_usage(deep=True).sum())
+        usage[f'{dataset}-grids'] = sum(grid.nbytes for grid in cube._grids.values()) # dense (group, year, KOMKODE) arrays
+    return usage
@@ -0,0 +1,245 @@
+"""
+Streaming CSV downloads, and the bulk export of a whole dataset (EXPORT_ROUTE).
+The CSV routes select rows from the indexed dataset (cube.DataCube) and send
+them as a streaming response, written CHUNK_ROWS rows at a time straight from
+the selected slice. The full file is never held in memory, and it is gzipped on
+the fly for clients that accept it.
+A download is a pure function of the query and the dataset, so responses carry
+an ETag (dataset hash + normalized query), Last-Modified (the dataset) and a
+public max-age. Browsers, proxies and CDNs can reuse them, and a conditional
+request is answered with 304 without writing the file.
+"""
+import io
+import os
+import re
+import json
+import zlib
+import hashlib
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import flask
+import pyarrow as pa
+import pyarrow.parquet as pq
+from werkzeug.http import http_date, quote_etag
+
+from ineq_app import app
+from data import DATASETS, get_cube, get_hash, get_modified
+
+CHUNK_ROWS = 10000 # rows per written chunk (CSV) or row group (Parquet)
+GZIP_LEVEL = 6
+DOWNLOAD_MAX_AGE = int(os.environ.get('DOWNLOAD_MAX_AGE', 3600)) # seconds a download may be reused without asking
+CSV_COLUMNS = ['KOMKODE', 'observations', 'year'] # followed by the measure
+CSV_HEADER = ['kommunekode', 'antal observationer', 'aar', 'vaerdi']
+EXPORT_ROUTE = '/export/<dataset>'
+RGB_COLOR = re.compile(r'rgb\(\d{1,3},\d{1,3},\d{1,3}\)') # line colors of the pages, e.g. 'rgb(13,143,148)'
+PARQUET_MIMETYPE = 'application/vnd.apache.parquet'
+
+def csv_chunks(df: pd.DataFrame, columns: list, header: list, rows: np.ndarray = None, chunk_rows: int = CHUNK_ROWS):
+    """
+    Yields CSV of df as utf-8 bytes, the header first and then chunk_rows rows
+    at a time. Only the rows of a chunk are copied while it is written.
+    Args:
+        df: rows to write, e.g. a slice from DataCube.select
+        columns: columns of df to write, in order
+        header: names in the header line, one for each column
+        rows: optional positions of the rows in df to write (default all)
+        chunk_rows: rows per chunk
+    """
+    yield df.iloc[:0].to_csv(columns=columns, header=header, index=False).encode('utf-8')
+    count = len(df) if rows is None else len(rows)
+    for start in range(0, count, chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows] if rows is None else df.iloc[rows[start:start + chunk_rows]]
+        yield chunk.to_csv(columns=columns, header=False, index=False).encode('utf-8')
+
+def gzip_chunks(chunks, level: int = GZIP_LEVEL):
+    """
+    Yields the chunks compressed as one gzip stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that keeps what is written until it is taken, so a Parquet
+    file can be sent while it is being written.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def parquet_chunks(df: pd.DataFrame, columns: list, rows: np.ndarray, chunk_rows: int = CHUNK_ROWS):
+    """
+    Yields a Parquet file of the columns of df, one row group of chunk_rows rows
+    at a time. Only the rows of a row group are copied while it is written.
+    Args:
+        df: rows to write, e.g. DataCube.df
+        columns: columns of df to write, in order
+        rows: positions of the rows in df to write
+        chunk_rows: rows per row group
+    """
+    positions = [df.columns.get_loc(c) for c in columns]
+    schema = pa.Schema.from_pandas(df.iloc[:0, positions], preserve_index=False)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    for start in range(0, len(rows), chunk_rows):
+        writer.write_table(pa.Table.from_pandas(df.iloc[rows[start:start + chunk_rows], positions], schema=schema, preserve_index=False))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+def check_selection(cube, measure: str, years: list = None, municipalities: list = None, colors: list = None, **selection):
+    """
+    Aborts the request with 400 unless the selection exists in the dataset, so
+    a bad link is not answered with a 500 from the lookups.
+    Args:
+        cube: dataset of the page
+        measure: must be one of cube.measures
+        years: optional years of the request (e.g. [year] for a map), each must be one of cube.years
+        municipalities: optional names, must be in the dataset
+        colors: optional line colors, one 'rgb(r,g,b)' per municipality
+        selection: value for every dimension, e.g. variable='Gini', gender='all'
+    """
+    if measure not in cube.measures:
+        flask.abort(400, f'unknown measure: {measure}')
+    for dim in cube.dims:
+        if selection.get(dim) not in cube.values[dim]:
+            flask.abort(400, f'unknown value of {dim}: {selection.get(dim)}')
+    for year in years or []:
+        if str(year) not in {str(y) for y in cube.years}:
+            flask.abort(400, f'unknown year: {year}')
+    if municipalities:
+        names = set(cube.names)
+        if not all(m in names for m in municipalities):
+            flask.abort(400, 'unknown municipality')
+        if not colors or len(colors) < len(municipalities) or not all(RGB_COLOR.fullmatch(c) for c in colors):
+            flask.abort(400, 'one rgb color per municipality')
+
+def accepts_gzip() -> bool:
+    return 'gzip' in flask.request.headers.get('Accept-Encoding', '')
+
+def download_etag(dataset: str) -> str:
+    """
+    Returns ETag of the current request: hash of the dataset content and the
+    query, with parameters (and repeated values) sorted, so the same download
+    has the same ETag however the URL was written.
+    Arg:
+        dataset: name of dataset, e.g. 'income'
+    """
+    query = sorted((name, value) for name, values in flask.request.args.lists() for value in values)
+    text = json.dumps([get_hash(dataset), query])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+def not_modified(etag: str, modified: float) -> bool:
+    """
+    Returns True if the client already has the response (If-None-Match, or
+    If-Modified-Since when there is no If-None-Match).
+    """
+    if flask.request.if_none_match:
+        return flask.request.if_none_match.contains_weak(etag)
+    since = flask.request.if_modified_since
+    return since is not None and datetime.fromtimestamp(int(modified), timezone.utc) <= since
+
+def send_csv(df: pd.DataFrame, measure: str, filename: str, dataset: str, rows: np.ndarray = None):
+    """
+    Returns streaming response with KOMKODE, observations, year and measure of
+    df as CSV download, gzipped if the client accepts it, or 304 if the client
+    has it already.
+    Args:
+        df: selected rows, e.g. from DataCube.select
+        measure: column written as 'vaerdi', e.g. 'Gini'
+        filename: name of the download, e.g. 'RFF-kort.csv'
+        dataset: name of the dataset df is from, e.g. 'income'
+        rows: optional positions of the rows in df to write (default all)
+    """
+    chunks = csv_chunks(df, CSV_COLUMNS + [measure], CSV_HEADER, rows)
+    return send_stream(chunks, 'text/csv', filename, dataset)
+
+def send_stream(chunks, mimetype: str, filename: str, dataset: str, compress: bool = True):
+    """
+    Returns streaming response of chunks (a generator, not started before it
+    is sent) as download with the caching headers of the dataset, or 304 if the
+    client has it already.
+    Args:
+        chunks: file content as generator of bytes, e.g. csv_chunks(...)
+        mimetype: e.g. 'text/csv'
+        filename: name of the download, e.g. 'RFF-kort.csv'
+        dataset: name of the dataset the content is from, e.g. 'income'
+        compress: gzip if the client accepts it (not for formats compressed already)
+    """
+    gzipped = compress and accepts_gzip()
+    etag = download_etag(dataset) + ('-gzip' if gzipped else '') # the bytes differ per encoding
+    modified = get_modified(dataset)
+    headers = {
+        'Cache-Control': f'public, max-age={DOWNLOAD_MAX_AGE}',
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(modified),
+        'Vary': 'Accept-Encoding',
+    }
+    if not_modified(etag, modified):
+        return flask.Response(status=304, headers=headers)
+    headers['Content-Disposition'] = f'attachment; filename={filename}'
+    if gzipped:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return flask.Response(chunks, mimetype=mimetype, headers=headers)
+
+def _bad_request(message: str):
+    return flask.Response(message, status=400, mimetype='text/plain')
+
+@app.server.route(EXPORT_ROUTE)
+def export(dataset):
+    """
+    Bulk export of a dataset, e.g.
+    /export/income?variable=aekvivadisp&gender=woman&gender=man&year=2018&measures=Gini&format=parquet
+    Every dimension of the dataset, year and KOMKODE can be given any number of
+    times and match any of their values; dimensions not given match all rows.
+    measures picks the measure columns (default all). format is 'csv' (default)
+    or 'parquet'. The rows are streamed straight from
+    the loaded dataset, in its sort order.
+    """
+    if dataset not in DATASETS:
+        flask.abort(404)
+    cube = get_cube(dataset)
+    args = flask.request.args
+    unknown = set(args) - set(cube.dims) - {'year', 'KOMKODE', 'measures', 'format'}
+    if unknown:
+        return _bad_request(f'Ukendte parametre: {", ".join(sorted(unknown))}')
+    measures = args.getlist('measures') or cube.measures
+    if not set(measures) <= set(cube.measures):
+        return _bad_request(f'Ukendte mål: {", ".join(sorted(set(measures) - set(cube.measures)))}')
+    try:
+        years = [int(y) for y in args.getlist('year')] or None
+        komkoder = [int(k) for k in args.getlist('KOMKODE')] or None
+    except ValueError:
+        return _bad_request('year og KOMKODE skal være heltal')
+    predicates = {d: set(args.getlist(d)) for d in cube.dims if d in args}
+    rows = cube.rows(years=years, komkoder=komkoder, **predicates)
+    columns = cube.dims + ['year', 'KOMKODE', 'municipality', 'observations'] + list(measures)
+    format = args.get('format', 'csv')
+    if format == 'csv':
+        return send_stream(csv_chunks(cube.df, columns, columns, rows), 'text/csv', f'RFF-{dataset}.csv', dataset)
+    if format == 'parquet':
+        return send_stream(parquet_chunks(cube.df, columns, rows), PARQUET_MIMETYPE, f'RFF-{dataset}.parquet', dataset, compress=False)
+    return _bad_request('format skal være csv eller parquet')
@@ -0,0 +1,297 @@
+"""
+Municipality geometry as shared arcs, and simplification of it.
+The border between two neighbouring municipalities is stored once as an arc,
+so simplifying the arcs keeps shared borders identical on both sides (no gaps
+or overlaps between municipalities at any level). On disk and over the wire
+the arcs are TopoJSON with quantized, delta encoded coordinates.
+"""
+import json
+import numpy as np
+
+# Douglas-Peucker tolerance in degrees per render target
+LEVELS = {
+    'png': 0.002, # image export, up to ~2000px wide
+    'screen': 0.005, # map in the page, ~500-800px wide (~0.01 degrees per pixel)
+    'thumb': 0.02, # thumbnails and animation frames
+}
+PRECISION = 5 # decimals kept in written coordinates (~1 m)
+QUANTIZATION = 10**6 # grid steps per axis of the source artifact (< 1 m)
+LEVEL_QUANTIZATION = 10**5 # grid steps per axis of the simplified levels (~7 m)
+OBJECT = 'kommuner' # name of the GeometryCollection in the TopoJSON
+INSET = [400, 411] # Bornholm and Christiansø, moved north-east of Zealand and drawn in a box
+INSET_PADDING = (0.1, 0.065) # degrees (lon, lat) between the inset and its box
+VIEW_PADDING = 0.05 # margin around the map as share of its extent, as fitbounds pads the locations
+
+def _polygons(geometry: dict) -> list:
+    """
+    Returns list of polygons, each a list of rings of (lon, lat) tuples without the closing point.
+    """
+    coordinates = geometry['coordinates']
+    if geometry['type'] == 'Polygon':
+        coordinates = [coordinates]
+    return [[[(p[0], p[1]) for p in ring[:-1]] for ring in polygon] for polygon in coordinates]
+
+def _junctions(rings: list) -> set:
+    """
+    Returns the points where a border starts or stops being shared, i.e. points
+    seen with different neighbouring points in different rings.
+    """
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring)
+        for i, p in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+            seen = neighbours.setdefault(p, pair)
+            if seen != pair:
+                junctions.add(p)
+    return junctions
+
+def build_topology(geojson: dict) -> dict:
+    """
+    Returns the geometry as shared arcs:
+    {'arcs': [(n, 2) arrays], 'features': [{'KOMKODE': .., 'type': .., 'polygons': [[ring, ..], ..]}]}
+    A ring is a list of arc references: i for arc i, ~i for arc i reversed (as in TopoJSON).
+    Arg:
+        geojson: FeatureCollection with properties.KOMKODE
+    """
+    features = [(f['properties']['KOMKODE'], f['geometry']['type'], _polygons(f['geometry'])) for f in geojson['features']]
+    junctions = _junctions([ring for _, _, polygons in features for polygon in polygons for ring in polygon])
+    arcs = []
+    index = {} # tuple of points -> arc reference
+
+    def add_arc(points: list) -> int:
+        key = tuple(points)
+        if key not in index:
+            reverse = key[::-1]
+            if reverse in index:
+                return ~index[reverse]
+            if points[0] == points[-1]: # closed ring without junctions, may be stored from another start point
+                start = min(range(len(points) - 1), key=lambda i: points[i])
+                key = tuple(points[start:-1] + points[:start + 1])
+                if key in index:
+                    return index[key]
+                if key[::-1] in index:
+                    return ~index[key[::-1]]
+                points = list(key)
+            index[key] = len(arcs)
+            arcs.append(np.array(points))
+        return index[key]
+
+    out = []
+    for komkode, kind, polygons in features:
+        refs = []
+        for polygon in polygons:
+            polygon_refs = []
+            for ring in polygon:
+                cuts = [i for i, p in enumerate(ring) if p in junctions]
+                if not cuts:
+                    polygon_refs.append([add_arc(ring + ring[:1])])
+                    continue
+                ring = ring[cuts[0]:] + ring[:cuts[0]] # start at a junction
+                cuts = [c - cuts[0] for c in cuts] + [len(ring)]
+                ring = ring + ring[:1]
+                polygon_refs.append([add_arc(ring[a:b + 1]) for a, b in zip(cuts[:-1], cuts[1:])])
+            refs.append(polygon_refs)
+        out.append({'KOMKODE': komkode, 'type': kind, 'polygons': refs})
+    return {'arcs': arcs, 'features': out}
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Returns boolean mask of the points kept by Douglas-Peucker simplification.
+    The first and last point are always kept.
+    Args:
+        points: (n, 2) array
+        tolerance: max distance (same unit as points) between the line and a dropped point
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, stop = stack.pop()
+        if stop - start < 2:
+            continue
+        a, b = points[start], points[stop]
+        segment = points[start + 1:stop]
+        dx, dy = b - a
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(*(segment - a).T)
+        else:
+            distances = np.abs(dx * (segment[:, 1] - a[1]) - dy * (segment[:, 0] - a[0])) / length
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, stop))
+    return keep
+
+def simplify_arcs(arcs: list, tolerance: float) -> list:
+    """
+    Returns the arcs simplified with Douglas-Peucker. Closed arcs (whole rings)
+    keep at least a triangle, so no municipality or island disappears.
+    """
+    out = []
+    for arc in arcs:
+        if len(arc) > 3 and (arc[0] == arc[-1]).all():
+            far = int(np.argmax(np.hypot(*(arc - arc[0]).T)))
+            keep = np.concatenate([douglas_peucker(arc[:far + 1], tolerance)[:-1], douglas_peucker(arc[far:], tolerance)])
+            if keep.sum() < 4: # keep the point farthest from the line start - far as third corner
+                dx, dy = arc[far] - arc[0]
+                keep[int(np.argmax(np.abs(dx * (arc[:, 1] - arc[0, 1]) - dy * (arc[:, 0] - arc[0, 0]))))] = True
+            out.append(arc[keep])
+        else:
+            out.append(arc[douglas_peucker(arc, tolerance)])
+    return out
+
+def _ring(arcs: list, refs: list) -> list:
+    """
+    Returns closed ring of rounded [lon, lat] from arc references.
+    """
+    points = []
+    for ref in refs:
+        arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        arc = np.round(arc, PRECISION).tolist()
+        points.extend(arc if not points else arc[1:])
+    ring = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]] # rounding can merge points
+    return ring
+
+def simplify_topology(topology: dict, tolerance: float) -> dict:
+    """
+    Returns copy of a topology with its arcs simplified with tolerance (degrees).
+    Rings that would collapse to less than a triangle keep their arcs unsimplified.
+    Args:
+        topology: from build_topology or decode_topojson
+        tolerance: Douglas-Peucker tolerance, 0 keeps every point
+    """
+    arcs = simplify_arcs(topology['arcs'], tolerance) if tolerance else list(topology['arcs'])
+    for feature in topology['features']: # shared arcs: fixing one ring fixes its neighbours too
+        for polygon in feature['polygons']:
+            for refs in polygon:
+                if len(_ring(arcs, refs)) < 4:
+                    for ref in refs:
+                        i = ref if ref >= 0 else ~ref
+                        arcs[i] = topology['arcs'][i]
+    return {'arcs': arcs, 'features': topology['features']}
+
+def to_geojson(topology: dict, tolerance: float = 0) -> dict:
+    """
+    Returns FeatureCollection from a topology, simplified with tolerance (degrees).
+    Args:
+        topology: from build_topology or decode_topojson
+        tolerance: Douglas-Peucker tolerance, 0 keeps every point
+    """
+    arcs = simplify_topology(topology, tolerance)['arcs']
+    features = []
+    for feature in topology['features']:
+        polygons = [[_ring(arcs, refs) for refs in polygon] for polygon in feature['polygons']]
+        geometry = {'type': 'Polygon', 'coordinates': polygons[0]} if feature['type'] == 'Polygon' else {'type': 'MultiPolygon', 'coordinates': polygons}
+        features.append({'type': 'Feature', 'properties': {'KOMKODE': feature['KOMKODE']}, 'geometry': geometry})
+    return {'type': 'FeatureCollection', 'features': features}
+
+def encode_topojson(topology: dict, quantization: int = QUANTIZATION) -> dict:
+    """
+    Returns the topology as TopoJSON: coordinates quantized to integers on a
+    quantization x quantization grid over the bounding box, and every arc stored
+    as its first position followed by the differences to the previous one.
+    Points that fall on the same grid position are merged.
+    Args:
+        topology: from build_topology or simplify_topology
+        quantization: grid steps per axis, see QUANTIZATION
+    """
+    points = np.concatenate(topology['arcs'])
+    lower = points.min(axis=0)
+    scale = (points.max(axis=0) - lower) / (quantization - 1)
+    arcs = []
+    for arc in topology['arcs']:
+        grid = np.round((arc - lower) / scale).astype('int64')
+        grid = grid[np.r_[True, (np.diff(grid, axis=0) != 0).any(axis=1)]]
+        if len(grid) < 2: # arc shorter than a grid step, keep it as a point
+            grid = np.concatenate([grid, grid])
+        arcs.append(np.concatenate([grid[:1], np.diff(grid, axis=0)]).tolist())
+    geometries = [{
+        'type': feature['type'],
+        'arcs': feature['polygons'][0] if feature['type'] == 'Polygon' else feature['polygons'],
+        'properties': {'KOMKODE': feature['KOMKODE']},
+    } for feature in topology['features']]
+    return {
+        'type': 'Topology',
+        'transform': {'scale': scale.tolist(), 'translate': lower.tolist()},
+        'arcs': arcs,
+        'objects': {OBJECT: {'type': 'GeometryCollection', 'geometries': geometries}},
+    }
+
+def decode_topojson(topojson: dict) -> dict:
+    """
+    Returns topology (as from build_topology) from TopoJSON written by encode_topojson.
+    Same decoding as decodeTopology() in assets/maps.js.
+    """
+    scale = np.array(topojson['transform']['scale'])
+    translate = np.array(topojson['transform']['translate'])
+    arcs = [np.cumsum(np.array(arc, dtype='int64'), axis=0) * scale + translate for arc in topojson['arcs']]
+    features = [{
+        'KOMKODE': g['properties']['KOMKODE'],
+        'type': g['type'],
+        'polygons': [g['arcs']] if g['type'] == 'Polygon' else g['arcs'],
+    } for g in topojson['objects'][OBJECT]['geometries']]
+    return {'arcs': arcs, 'features': features}
+
+def _bbox(points: np.ndarray) -> list:
+    return np.concatenate([points.min(axis=0), points.max(axis=0)]).tolist()
+
+def viewport(topology: dict) -> dict:
+    """
+    Returns the fixed map view of the geometry:
+    {'bbox': [lon0, lat0, lon1, lat1], 'center': {'lon', 'lat'}, 'lonaxis_range': [..], 'lataxis_range': [..],
+    'inset': {'lon': [..], 'lat': [..]}} where inset is the closed box drawn around INSET.
+    The ranges cover every municipality and the inset box, so the view does not
+    depend on which municipalities have a value.
+    Arg:
+        topology: from build_topology or decode_topojson
+    """
+    def points(features):
+        return np.concatenate([topology['arcs'][ref if ref >= 0 else ~ref] for f in features for polygon in f['polygons'] for refs in polygon for ref in refs])
+    lon0, lat0, lon1, lat1 = _bbox(points([f for f in topology['features'] if f['KOMKODE'] in INSET]))
+    lon0, lat0, lon1, lat1 = lon0 - INSET_PADDING[0], lat0 - INSET_PADDING[1], lon1 + INSET_PADDING[0], lat1 + INSET_PADDING[1]
+    inset = {'lon': [lon0, lon0, lon1, lon1, lon0], 'lat': [lat0, lat1, lat1, lat0, lat0]}
+    bbox = _bbox(np.concatenate([points(topology['features']), np.array([[lon0, lat0], [lon1, lat1]])]))
+    pad_lon = (bbox[2] - bbox[0]) * VIEW_PADDING
+    pad_lat = (bbox[3] - bbox[1]) * VIEW_PADDING
+    view = {
+        'bbox': bbox,
+        'center': {'lon': (bbox[0] + bbox[2]) / 2, 'lat': (bbox[1] + bbox[3]) / 2},
+        'lonaxis_range': [bbox[0] - pad_lon, bbox[2] + pad_lon],
+        'lataxis_range': [bbox[1] - pad_lat, bbox[3] + pad_lat],
+        'inset': inset,
+    }
+    return json.loads(json.dumps(view), parse_float=lambda v: round(float(v), PRECISION))
+
+def exterior_rings(geojson: dict) -> dict:
+    """
+    Returns dict with KOMKODE as key and the outline of the municipality as value:
+    {'lon': [..], 'lat': [..]} with the exterior ring of every polygon (all islands
+    of a MultiPolygon), separated by None so they draw as one line trace.
+    Served to the browser for the hover outline (maps.OUTLINES_ROUTE).
+    Arg:
+        geojson: FeatureCollection with properties.KOMKODE
+    """
+    index = {}
+    for feature in geojson['features']:
+        geometry = feature['geometry']
+        polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        lon, lat = [], []
+        for polygon in polygons:
+            if lon:
+                lon.append(None)
+                lat.append(None)
+            lon.extend(p[0] for p in polygon[0])
+            lat.extend(p[1] for p in polygon[0])
+        index[feature['properties']['KOMKODE']] = {'lon': lon, 'lat': lat}
+    return index
+
+def count_points(geojson: dict) -> int:
+    """
+    Returns number of coordinate pairs in a FeatureCollection.
+    """
+    return sum(len(ring) + 1 for f in geojson['features'] for polygon in _polygons(f['geometry']) for ring in polygon)
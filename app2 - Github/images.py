@@ -0,0 +1,264 @@
+"""
+Server side rendering of figures to images for the downloads.
+Images are rendered when a download is requested (not on every figure change)
+and kept in a bounded cache keyed by a hash of the figure, so a figure that is
+downloaded again is not rendered again. Renders run on a pool of warm kaleido
+processes (RendererPool), so concurrent exports do not queue behind the single
+process of plotly.io.to_image. Besides PNG, figures can be exported as vector
+graphics (SVG, PDF) for reports, see IMAGE_FORMATS.
+"""
+import io
+import os
+import json
+import time
+import queue
+import logging
+import zipfile
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import plotly
+import plotly.io as pio
+import flask
+from kaleido.scopes.plotly import PlotlyScope
+
+from ineq_app import app
+
+IMAGE_CACHE_SIZE = int(os.environ.get('IMAGE_CACHE_SIZE', 64)) # rendered images kept per worker
+RENDER_POOL_SIZE = int(os.environ.get('RENDER_POOL_SIZE', min(os.cpu_count() or 1, 4))) # kaleido processes per worker
+RENDER_TIMEOUT = float(os.environ.get('RENDER_TIMEOUT', 30)) # seconds for one render
+RENDER_QUEUE_TIMEOUT = float(os.environ.get('RENDER_QUEUE_TIMEOUT', 30)) # seconds to wait for a free process
+RENDER_KILL_WAIT = 5 # seconds to wait for a killed process to exit
+IMAGE_STATS_ROUTE = '/stats/images'
+IMAGE_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml', 'pdf': 'application/pdf'} # export format -> mimetype
+
+logger = logging.getLogger(__name__)
+
+class RenderTimeout(Exception):
+    """
+    No kaleido process was free within the queue timeout, or a render took too long.
+    """
+
+def _new_scope() -> PlotlyScope:
+    """
+    Returns a kaleido scope with the same plotly.js and MathJax as plotly.io.to_image.
+    Its process starts on the first transform.
+    """
+    return PlotlyScope(plotlyjs=pio.kaleido.scope.plotlyjs, mathjax=pio.kaleido.scope.mathjax)
+
+def _warm(scope: PlotlyScope):
+    """
+    Starts the process of a scope and loads plotly.js with an empty figure.
+    """
+    try:
+        scope.transform({'data': [], 'layout': {}}, format='png')
+    except Exception:
+        pass # started again on the next render
+
+def _kill(scope: PlotlyScope, timeout: float = RENDER_KILL_WAIT):
+    """
+    Kills the process of a hung scope and reaps it, so it does not stay as a
+    zombie. kaleido has no public way to do this; if its private _proc is not
+    there (e.g. another kaleido version), the process is left alone.
+    """
+    proc = getattr(scope, '_proc', None)
+    if proc is None:
+        return
+    try:
+        proc.kill()
+        proc.wait(timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        logger.warning('kaleido process %s did not exit after kill', proc.pid, exc_info=True)
+
+class RendererPool:
+    """
+    Warm kaleido processes shared by the threads of a worker. A render takes an
+    idle process from the queue, waiting at most queue_timeout. A render that
+    takes longer than timeout kills its process, which is replaced by a new one.
+    Args:
+        size: number of kaleido processes
+        timeout: seconds for one render
+        queue_timeout: seconds to wait for a free process
+    """
+    def __init__(self, size: int = RENDER_POOL_SIZE, timeout: float = RENDER_TIMEOUT, queue_timeout: float = RENDER_QUEUE_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {'renders': 0, 'errors': 0, 'timeouts': 0, 'queue_timeouts': 0, 'waiting': 0, 'max_waiting': 0, 'busy': 0, 'wait_seconds': 0.0, 'render_seconds': 0.0}
+        for _ in range(size):
+            scope = _new_scope()
+            self._idle.put(scope)
+            threading.Thread(target=_warm, args=(scope,), daemon=True).start()
+
+    def _count(self, **changes):
+        with self._lock:
+            for name, change in changes.items():
+                self._stats[name] += change
+            self._stats['max_waiting'] = max(self._stats['max_waiting'], self._stats['waiting'])
+
+    def render(self, fig: dict, format: str = 'png', **options) -> bytes:
+        """
+        Returns the figure rendered by one of the processes.
+        Raises RenderTimeout if no process is free in time or the render takes too long.
+        Args:
+            fig: figure dict
+            format: 'png', 'svg', 'pdf', ...
+            options: width, height, scale
+        """
+        queued = time.time()
+        self._count(waiting=1)
+        try:
+            scope = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            self._count(queue_timeouts=1)
+            logger.warning('no free renderer within %ss (%s waiting)', self.queue_timeout, self._stats['waiting'])
+            raise RenderTimeout(f'no free renderer within {self.queue_timeout}s')
+        finally:
+            self._count(waiting=-1)
+        started = time.time()
+        self._count(busy=1, wait_seconds=started - queued)
+        result = {}
+        def run():
+            try:
+                result['image'] = scope.transform(fig, format=format, **options)
+            except Exception as e:
+                result['error'] = e
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        try:
+            if thread.is_alive():
+                _kill(scope) # kaleido has no timeout of its own, run() then fails
+                scope = _new_scope()
+                threading.Thread(target=_warm, args=(scope,), daemon=True).start()
+                self._count(timeouts=1)
+                logger.warning('render took more than %ss, kaleido process replaced', self.timeout)
+                raise RenderTimeout(f'render took more than {self.timeout}s')
+            if 'error' in result:
+                self._count(errors=1)
+                raise result['error']
+            self._count(renders=1)
+            return result['image']
+        finally:
+            self._idle.put(scope)
+            self._count(busy=-1, render_seconds=time.time() - started)
+
+    def stats(self) -> dict:
+        """
+        Returns counters: renders, errors, timeouts, queue_timeouts, waiting (queue
+        depth now), max_waiting, busy, idle and total wait/render seconds.
+        """
+        with self._lock:
+            return dict(self._stats, size=self.size, idle=self._idle.qsize())
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> RendererPool:
+    """
+    Returns the renderer pool of this worker, started on the first export.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RendererPool()
+        return _pool
+
+@app.server.errorhandler(RenderTimeout)
+def render_timeout(error):
+    return flask.Response('Billedet kunne ikke laves lige nu. Prøv igen om lidt.', status=503, headers={'Retry-After': '10'}, mimetype='text/plain')
+
+_images = OrderedDict() # figure hash -> image bytes
+_lock = threading.Lock()
+_stats = {'hits': 0, 'renders': 0}
+
+def figure_hash(fig: dict, format: str = 'png', **options) -> str:
+    """
+    Returns sha256 hex digest of a figure dict and the render options.
+    """
+    text = json.dumps([fig, format, options], cls=plotly.utils.PlotlyJSONEncoder, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def render_image(fig: dict, format: str = 'png', **options) -> bytes:
+    """
+    Returns the figure rendered by the renderer pool, from the cache if the same
+    figure has been rendered before.
+    Args:
+        fig: figure dict, with the geometry inlined for maps (maps.inline_geometry)
+        format: 'png', 'svg', 'pdf', ...
+        options: passed on to the kaleido transform, e.g. width, height, scale
+    """
+    key = figure_hash(fig, format, **options)
+    with _lock:
+        img = _images.get(key)
+        if img is not None:
+            _images.move_to_end(key)
+            _stats['hits'] += 1
+            return img
+    img = get_pool().render(fig, format, **options)
+    with _lock:
+        _stats['renders'] += 1
+        _images[key] = img
+        while len(_images) > IMAGE_CACHE_SIZE:
+            _images.popitem(last=False)
+    return img
+
+def render_many(figs: list, format: str = 'png', **options) -> list:
+    """
+    Returns the figures rendered in parallel on the renderer pool (cached as in
+    render_image), in the order of figs. Threads are enough: the rendering runs
+    in the kaleido processes of the pool.
+    Args:
+        figs: figure dicts
+        format: 'png', 'svg', 'pdf', ...
+        options: passed on to the kaleido transform, e.g. width, height, scale
+    """
+    with ThreadPoolExecutor(max_workers=get_pool().size) as executor:
+        return list(executor.map(lambda fig: render_image(fig, format, **options), figs))
+
+def zip_files(files: dict) -> bytes:
+    """
+    Returns zip archive of files, e.g. {'RFF-kort-2018.png': png bytes}.
+    PNGs are compressed already, so they are stored as they are.
+    """
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return out.getvalue()
+
+def animated_gif(frames: list, duration: int = 1000) -> bytes:
+    """
+    Returns animated GIF (looping) from PNG frames.
+    Args:
+        frames: PNG bytes, e.g. from render_many
+        duration: milliseconds per frame
+    """
+    from PIL import Image # only needed for animations
+    images = [Image.open(io.BytesIO(frame)).convert('RGB').convert('P', palette=Image.ADAPTIVE) for frame in frames]
+    out = io.BytesIO()
+    images[0].save(out, format='GIF', save_all=True, append_images=images[1:], duration=duration, loop=0, optimize=True)
+    return out.getvalue()
+
+def image_stats() -> dict:
+    """
+    Returns cache hits, renders and current size of the image cache, and the
+    counters of the renderer pool (None before the first render).
+    """
+    with _lock:
+        stats = dict(_stats, size=len(_images), maxsize=IMAGE_CACHE_SIZE)
+    stats['pool'] = _pool.stats() if _pool is not None else None
+    return stats
+
+@app.server.route(IMAGE_STATS_ROUTE)
+def serve_image_stats():
+    """
+    Cache and renderer pool counters of this worker (image_stats) as JSON, for monitoring.
+    """
+    response = flask.jsonify(image_stats())
+    response.headers['Cache-Control'] = 'no-store'
+    return response
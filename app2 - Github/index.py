@@ -17,6 +17,7 @@ from pages import (
     education,
     documentation,
 )
+import api # JSON API (/api/v1), registered on import
 
 # NOTE: dash-bootstrap-components==0.10.6
 
@@ -0,0 +1,317 @@
+"""
+Shared building blocks for the choropleth maps of the data pages.
+"""
+import os
+import gzip
+import json
+import hashlib
+from functools import lru_cache
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import flask
+from werkzeug.http import quote_etag
+
+from ineq_app import app
+from geometry import exterior_rings
+from data import get_geojson, get_topojson, get_viewport, get_komkoder
+
+komkoder2str, _ = get_komkoder()
+KOMKODER = np.array(list(komkoder2str.keys()), dtype='int16') # every municipality on the map
+NAMES = np.array(list(komkoder2str.values()), dtype=object)
+
+# embed the geometry in every map response instead of serving it once from GEOJSON_ROUTE
+INLINE_GEOJSON = os.environ.get('INLINE_GEOJSON', '0') == '1'
+GEOJSON_ROUTE = '/geo/kommuner-<version>.geojson'
+TOPOJSON_ROUTE = '/geo/kommuner-<version>.topojson' # same geometry, decoded by the browser (assets/maps.js)
+OUTLINES_ROUTE = '/geo/outlines-<version>.json' # KOMKODE -> exterior rings, for the hover outline (assets/maps.js)
+EXPORT_LEVELS = {'png': 'png', 'svg': 'screen', 'pdf': 'screen'} # image format -> geometry level; vectors keep every point, so less detail
+
+COLORSCALE_LEVEL = ['rgb(244,230,211)', 'rgb(244,190,117)', 'rgb(242,146,12)', 'rgb(219,126,15)', 'rgb(196,105,18)', 'rgb(162,75,23)', 'rgb(102,21,32)', 'rgb(51,11,16)']
+
+@lru_cache(maxsize=None)
+def _geometry_bytes() -> tuple:
+    """
+    Returns (version, {extension: (json bytes, gzipped json bytes)}) of the screen
+    level geometry as TopoJSON, as GeoJSON decoded from it and its outline index
+    (geometry.exterior_rings).
+    """
+    topojson = json.dumps(get_topojson('screen'), separators=(',', ':')).encode('utf-8')
+    geojson = json.dumps(get_geojson('screen'), separators=(',', ':')).encode('utf-8')
+    outlines = json.dumps(_outlines(), separators=(',', ':')).encode('utf-8')
+    version = hashlib.sha256(topojson).hexdigest()[:12]
+    bodies = {'topojson': topojson, 'geojson': geojson, 'outlines': outlines}
+    return version, {extension: (body, gzip.compress(body, 9)) for extension, body in bodies.items()}
+
+@lru_cache(maxsize=None)
+def _outlines() -> dict:
+    return exterior_rings(get_geojson('screen'))
+
+def map_geojson():
+    """
+    Returns what the map traces use as geojson: the URL of the screen level
+    geometry (fetched and cached once by the browser), or the geometry itself
+    if INLINE_GEOJSON.
+    """
+    if INLINE_GEOJSON:
+        return get_geojson('screen')
+    return GEOJSON_ROUTE.replace('<version>', _geometry_bytes()[0])
+
+def map_topojson():
+    """
+    Returns the URL of the screen level geometry as TopoJSON, or None if INLINE_GEOJSON.
+    """
+    if INLINE_GEOJSON:
+        return None
+    return TOPOJSON_ROUTE.replace('<version>', _geometry_bytes()[0])
+
+def map_outlines():
+    """
+    Returns the URL of the outline index of the screen level geometry, or the
+    index itself if INLINE_GEOJSON.
+    """
+    if INLINE_GEOJSON:
+        return _outlines()
+    return OUTLINES_ROUTE.replace('<version>', _geometry_bytes()[0])
+
+def inline_geometry(fig: dict, level: str = 'png') -> dict:
+    """
+    Returns copy of a figure dict with the geometry URL replaced by the geometry
+    of a render target level, for renderers without access to the app (e.g. kaleido).
+    Args:
+        fig: figure dict
+        level: 'png' for image exports, 'screen' for vector exports (EXPORT_LEVELS), 'thumb' for small images
+    """
+    data = [dict(trace, geojson=get_geojson(level)) if 'geojson' in trace else trace for trace in fig.get('data', [])]
+    return dict(fig, data=data)
+
+def _send_geometry(version: str, extension: str, mimetype: str, route: str):
+    """
+    Returns response with the geometry. The URL changes with the content, so it can be cached forever.
+    """
+    current, bodies = _geometry_bytes()
+    if version != current:
+        return flask.redirect(route.replace('<version>', current), code=301)
+    body, body_gzip = bodies[extension]
+    etag = f'{current}-{extension}'
+    headers = {'Cache-Control': 'public, max-age=31536000, immutable', 'ETag': quote_etag(etag), 'Vary': 'Accept-Encoding'}
+    if flask.request.if_none_match.contains_weak(etag):
+        return flask.Response(status=304, headers=headers)
+    if 'gzip' in flask.request.headers.get('Accept-Encoding', ''):
+        body = body_gzip
+        headers['Content-Encoding'] = 'gzip'
+    return flask.Response(body, mimetype=mimetype, headers=headers)
+
+@app.server.route(GEOJSON_ROUTE)
+def serve_geojson(version):
+    """
+    Serves the geometry as GeoJSON, for renderers without the TopoJSON decoder.
+    """
+    return _send_geometry(version, 'geojson', 'application/geo+json', GEOJSON_ROUTE)
+
+@app.server.route(TOPOJSON_ROUTE)
+def serve_topojson(version):
+    """
+    Serves the geometry as TopoJSON (about half the size of the GeoJSON).
+    """
+    return _send_geometry(version, 'topojson', 'application/json', TOPOJSON_ROUTE)
+
+@app.server.route(OUTLINES_ROUTE)
+def serve_outlines(version):
+    """
+    Serves the outline index: KOMKODE -> exterior rings of every polygon.
+    """
+    return _send_geometry(version, 'outlines', 'application/json', OUTLINES_ROUTE)
+
+@lru_cache(maxsize=None)
+def base_map(diverging: bool) -> dict:
+    """
+    Returns the static parts of a choropleth map as figure dict: geometry,
+    projection, color axis, layout, the Bornholm square and an empty outline
+    trace. The view is fixed (data.get_viewport) instead of fitted to the
+    locations on every render, so it does not move when municipalities are
+    missing. Built once per family and shared by the pages; map_figure fills
+    in the values.
+    Arg:
+        diverging: RdBu_r around 0 (diff_* measures), otherwise the level colorscale
+    """
+    view = get_viewport()
+    fig = go.Figure()
+    fig.add_trace(go.Choropleth(
+        featureidkey='properties.KOMKODE',
+        coloraxis='coloraxis',
+        geo='geo',
+        name='',
+    ))
+    fig.add_trace(go.Scattergeo(
+        lat=view['inset']['lat'],
+        lon=view['inset']['lon'],
+        mode='lines',
+        line=dict(color='rgb(0,0,0)', dash='solid'),
+        geo='geo',
+        legendgroup='',
+        name='',
+        showlegend=False,
+        hoverinfo='skip',
+    ))
+    fig.update_geos(
+        domain=dict(x=[0.0, 1.0], y=[0.0, 1.0]),
+        projection_type='mercator',
+        projection_rotation_lon=view['center']['lon'],
+        center=view['center'],
+        lonaxis_range=view['lonaxis_range'],
+        lataxis_range=view['lataxis_range'],
+        visible=False,
+    )
+    fig.update_layout(
+        font_family='Avenir Next',
+        margin={"r":0,"t":0,"l":0,"b":0},
+        font_size=12,
+        separators=",..",
+        autosize=True,
+        legend_tracegroupgap=0,
+        coloraxis=dict(
+            colorscale=px.colors.diverging.RdBu_r if diverging else COLORSCALE_LEVEL,
+            colorbar=dict(title_text='', tickformat='', x=-0.05),
+        ),
+    )
+    if diverging:
+        fig.update_layout(coloraxis_cmid=0)
+    fig.add_annotation(x=0.5, y=0, text='', showarrow=False)
+    fig = fig.to_dict()
+    fig['data'][0]['geojson'] = map_geojson() # shared, not a copy per figure
+    fig['data'].append(outline_trace())
+    return fig
+
+def outline_trace() -> dict:
+    """
+    Returns the empty line trace that outlines the hovered municipality. The
+    browser fills in its rings from the outline index (map_outlines), see
+    recolor() in assets/maps.js.
+    """
+    return dict(
+        type='scattergeo',
+        lon=[],
+        lat=[],
+        mode='lines',
+        line=dict(color='rgb(0,0,0)', width=2),
+        geo='geo',
+        name='outline',
+        showlegend=False,
+        hoverinfo='skip',
+    )
+
+def map_payload(komkoder, values, observations, hovertemplate: str, diverging: bool = False, colorbar_title: str = '', tickformat: str = '', annotation: str = '') -> dict:
+    """
+    Returns the compact values of a map for the clientside recoloring
+    (assets/maps.js): one row [KOMKODE, value, observations...] per municipality
+    plus the texts of the selection. The geometry and layout are in map_base().
+    Args:
+        komkoder: municipality codes (locations)
+        values: value per municipality (z)
+        observations: one or two sequences of observation counts per municipality, shown on hover
+        hovertemplate: hover text, customdata is [name, value, observations...]
+        diverging: RdBu_r around 0 (diff_* measures), otherwise the level colorscale from min to max
+        colorbar_title: e.g. 'DKK'
+        tickformat: colorbar tickformat, e.g. ',.000'
+        annotation: text below the map
+    """
+    columns = [np.asarray(komkoder).tolist(), np.asarray(values, dtype=float).tolist()]
+    columns += [np.asarray(obs).tolist() for obs in observations]
+    return {
+        'rows': [list(row) for row in zip(*columns)],
+        'hovertemplate': hovertemplate,
+        'diverging': diverging,
+        'colorbar_title': colorbar_title,
+        'tickformat': tickformat,
+        'annotation': annotation,
+    }
+
+def map_base() -> dict:
+    """
+    Returns what the browser needs once per page to draw maps from map_payload:
+    both base figures, the missing-municipality trace, the municipality names,
+    the URL of the geometry as TopoJSON and of the outline index.
+    """
+    return {
+        'topojson': map_topojson(),
+        'outlines': map_outlines(),
+        'level': base_map(False),
+        'diverging': base_map(True),
+        'missing': _missing_base(),
+        'names': [[0, 'Hele Danmark']] + [[int(k), str(n)] for k, n in zip(KOMKODER, NAMES)],
+    }
+
+def map_figure(payload: dict) -> dict:
+    """
+    Returns choropleth figure dict for a map payload, built from the prebuilt
+    base map. Same figure as the clientside recolor() in assets/maps.js (without
+    hover), for rendering on the server (e.g. image exports).
+    Arg:
+        payload: dict from map_payload
+    """
+    base = base_map(payload['diverging'])
+    names = dict(map_base()['names'])
+    rows = payload['rows']
+    komkoder = [row[0] for row in rows]
+    values = np.array([row[1] for row in rows], dtype=float)
+    customdata = [[names.get(row[0], '')] + list(row[1:]) for row in rows]
+    trace = dict(base['data'][0], locations=komkoder, z=values, customdata=customdata, hovertemplate=payload['hovertemplate'])
+    coloraxis = dict(base['layout']['coloraxis'])
+    coloraxis['colorbar'] = dict(coloraxis['colorbar'], title={'text': payload['colorbar_title']}, tickformat=payload['tickformat'])
+    if not payload['diverging']:
+        coloraxis['cmin'] = values.min() if len(values) else np.nan
+        coloraxis['cmax'] = values.max() if len(values) else np.nan
+    layout = dict(base['layout'], coloraxis=coloraxis, annotations=[dict(base['layout']['annotations'][0], text=payload['annotation'])])
+    data = [trace]
+    missing_map = missing_trace(komkoder)
+    if missing_map is not None: # if some municipalities are missing
+        data.append(missing_map)
+    data += base['data'][1:] # Bornholm square, then the empty outline on top
+    return {'data': data, 'layout': layout}
+
+def missing_municipalities(komkoder) -> np.ndarray:
+    """
+    Returns boolean mask over KOMKODER of the municipalities not in komkoder.
+    Arg:
+        komkoder: municipality codes with a value, e.g. the KOMKODE column of a map
+    """
+    return ~np.isin(KOMKODER, np.asarray(komkoder))
+
+def _missing_base() -> dict:
+    """
+    Returns the gray "Få observationer" trace without locations.
+    """
+    return dict(
+        type='choropleth',
+        geojson=map_geojson(),
+        featureidkey='properties.KOMKODE',
+        colorscale=[[0.0, 'gray'], [1.0, 'gray']],
+        showscale=False,
+        showlegend=False,
+        name='missing',
+        geo='geo',
+        hovertemplate=(
+            "<b>%{customdata[0]}</b><br>"+\
+            "Få observationer" + \
+            "<extra></extra>"
+        ),
+    )
+
+def missing_trace(komkoder):
+    """
+    Returns gray choropleth trace dict ("Få observationer") for the municipalities
+    not in komkoder, or None if none are missing.
+    Arg:
+        komkoder: municipality codes with a value, e.g. the KOMKODE column of a map
+    """
+    missing = missing_municipalities(komkoder)
+    n = int(missing.sum())
+    if n == 0:
+        return None
+    return dict(
+        _missing_base(),
+        locations=KOMKODER[missing],
+        z=np.ones(n, dtype=int),
+        customdata=np.stack((NAMES[missing], np.full(n, 'missing', dtype=object)), axis=-1),
+    )
@@ -1,15 +1,9 @@
-import io
-import json
 import urllib
-import base64
 import numpy as np
-import pandas as pd
-import plotly
-import plotly.express as px
 import plotly.graph_objects as go
 import flask
 import dash
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
@@ -17,32 +11,29 @@ from dash.exceptions import PreventUpdate
 
 ### import functions from directories ###
 from ineq_app import app
+from data import get_komkoder, get_cube, get_hash
+from cache import FigureCache, DiskCache
+from maps import map_payload, map_base, map_figure, inline_geometry, EXPORT_LEVELS
+from images import render_image, render_many, zip_files, animated_gif, IMAGE_FORMATS
+from artifacts import send_artifact
+from downloads import send_csv, check_selection
 from utils import(
     navigation2,
     top_banner,
-    path2file,
     encode_svg,
     labels_dict,
     RF_orange,
     RF_gray,
     download_dropdown,
     button_help,
-    # get_highlights,
-    # get_coordinates
 )
 
 ### load in data ###
-with open(path2file('kommuner4.geojson')) as geo:
-    geojson = json.load(geo)
-
-with open(path2file('kommune_koder.json'), encoding='utf-8') as komk:
-    komkoder  = json.load(komk)
-komkoder2str = {int(k): str(v) for k, v in komkoder.items()}
-komstr2koder = {str(v): int(k) for k, v in komkoder.items()}
-
-df = pd.read_csv(path2file('education.csv'))
-df = df.astype({'KOMKODE':'int', 'year':'int'}) # ensure correct type
-df = df.sort_values(by=['year', 'KOMKODE'])
+komkoder2str, komstr2koder = get_komkoder()
+cube = get_cube('education')
+map_cache = FigureCache() # map payloads by selector tuple
+# finished line graphs by selector tuple, in memory and on disk for all workers
+line_cache = FigureCache(disk=DiskCache('education-line', get_hash('education')))
 
 edu_icon = encode_svg('edu_dark.svg')
 edu_icon_active = encode_svg('edu_orange.svg')
@@ -135,7 +126,7 @@ controls = dbc.Container([
             html.Div(
                 dbc.Select(
                     id='education-year-selector',
-                    options=[{'label': y, 'value': y} for y in df['year'].unique()],
+                    options=[{'label': y, 'value': y} for y in cube.years],
                     value=2018,
                 )
             ),
@@ -163,6 +154,8 @@ layout = html.Div([
     html.Div([navigation2()]),
     html.Div(dcc.Store(id='education-memory')), # reverts to default on every page refresh
     html.Div(dcc.Store(id='education-color-memory')), # reverts to default on every page refresh
+    html.Div(dcc.Store(id='education-map-values')), # map payload of the selection, drawn by assets/maps.js
+    html.Div(dcc.Store(id='education-map-base', data=map_base())), # geometry URL, layout and names for the maps
     html.Div([dbc.Fade(
         controls, id='education-control-fade', is_in=False, style={"transition": "opacity 200ms ease"}
     )
@@ -546,7 +539,7 @@ def click_list(clickData, data):
 
 ##### Begin plotting graphs #####
 @app.callback(
-    Output('education-map-graph', 'figure'),
+    Output('education-map-values', 'data'),
     [Input('education-variable-selector', 'value'),
     Input('education-measure-selector', 'value'),
     Input('education-gender-selector', 'value'),
@@ -554,174 +547,79 @@ def click_list(clickData, data):
     Input('education-heritage-selector', 'value'),
     Input('education-year-selector', 'value')]
 )
+@map_cache.memoize
 def update_map(selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_year):
-    dfs = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage)].copy()
-    dfs.dropna(axis=0, subset=[selected_measure], inplace=True)
-    colorscale_level = ['rgb(244,230,211)', 'rgb(244,190,117)', 'rgb(242,146,12)', 'rgb(219,126,15)', 'rgb(196,105,18)', 'rgb(162,75,23)', 'rgb(102,21,32)', 'rgb(51,11,16)']
-
-    rdf = pd.DataFrame(columns=['KOMKODE','val', 'municipality'])
-    ### Get missing kommuner ###
-    missing_mun_list = []
-    for k in komkoder2str.keys():
-        if k not in dfs['KOMKODE'].unique():
-            missing_mun_list.append(k)
-            rdf = rdf.append({'KOMKODE':k, 'municipality':komkoder2str.get(k), 'val':'missing'}, ignore_index=True)
-
+    dfs = cube.map(selected_measure, selected_year, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage)
     if selected_measure == 'diff_gender':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == 'woman') & (df['age'] == selected_age) & (df['heritage'] == selected_heritage)]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == 'man') & (df['age'] == selected_age) & (df['heritage'] == selected_heritage)]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'År'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal kvinder: %{customdata[2]:,}<br>" +\
-                "Antal mænd: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('gender', ('woman', 'man'), selected_year, dfs['KOMKODE'], variable=selected_variable, age=selected_age, heritage=selected_heritage)
+        diverging = True
+        colorbar_title = 'År'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal kvinder: %{customdata[2]:,}<br>" +\
+            "Antal mænd: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at mænd har en længere uddannelse)'
     elif selected_measure == 'diff_heritage':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == 'danish')]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == 'nonwestern')]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'År'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal danskere: %{customdata[2]:,}<br>" +\
-                "Antal ikke-vestlige indvandrere og efterkommere: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('heritage', ('danish', 'nonwestern'), selected_year, dfs['KOMKODE'], variable=selected_variable, gender=selected_gender, age=selected_age)
+        diverging = True
+        colorbar_title = 'År'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal danskere: %{customdata[2]:,}<br>" +\
+            "Antal ikke-vestlige indvandrere og efterkommere: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at danskere har en længere uddannelse)'
     elif selected_measure == 'Gini' or selected_measure.startswith('Theil_') or selected_measure[1].isdigit():
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: ''},
-                            # color_continuous_midpoint=np.mean(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = ''
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
     elif selected_variable == 'hfpria' and selected_measure == 'mean':
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'År'},
-                            # color_continuous_midpoint=np.median(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = 'År'
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
 
     else:
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: ''},
-                            # color_continuous_midpoint=np.median(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = ''
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
 
-    fig.update_geos(fitbounds="locations", visible=False)
-    fig.update_layout(
-        font_family='Avenir Next',
-        # title_text='Hello world',
-        # width=1000,
-        # height=600,
-        margin={"r":0,"t":0,"l":0,"b":0},
-        font_size=12,
-        coloraxis_colorbar_tickformat='',
-        separators=",..",
-        autosize=True,
-        coloraxis=dict(
-            colorbar_x=-0.05
-        ),
-    )
-
-    ##### Add square around Bornholm #####
-    factorx = 0.1
-    factory = 0.065
-    x = [12.682574-factorx, 12.682574-factorx, 13.193236+factorx, 13.193236+factorx, 12.682574-factorx]
-    y = [56.986583-factory, 57.323286+factory, 57.323286+factory, 56.986583-factory, 56.986583-factory]
-    Bsquare = px.line_geo(lat=y, lon=x, projection='mercator',  color_discrete_sequence=['rgb(0,0,0)']*5)
-    Bsquare.data[0].showlegend=False
-    Bsquare.update_traces(
-       hovertemplate=None,
-       hoverinfo='skip'
-    )
-    fig.add_trace(Bsquare.data[0])
+    tickformat = ''
     anno_text1 = f'År: {selected_year}'
     if 'anno_text2' not in locals():
             anno_text2 = ''
     anno_text_final = '<br>'.join(filter(None, [anno_text1, anno_text2]))
-    fig.add_annotation(x=0.5, y=0, text=anno_text_final, showarrow=False)
-
-    if len(rdf) > 0: # if some municipalities are missing
-        missing_map = px.choropleth(rdf, geojson=geojson, color="val",
-                            locations="KOMKODE", featureidkey="properties.KOMKODE",
-                            projection="mercator", color_discrete_map={'missing':'gray'},
-                           )
-        missing_map.data[0].showlegend=False
-        missing_map.update_traces(
-            customdata= np.stack((rdf['municipality'], rdf['val']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Få observationer" + \
-                "<extra></extra>"
-            )
-        )
+    return map_payload(dfs['KOMKODE'], dfs[selected_measure], observations, hovertemplate,
+                       diverging=diverging, colorbar_title=colorbar_title, tickformat=tickformat, annotation=anno_text_final)
 
-        fig.add_trace(missing_map.data[0])
-    return fig
+# recolor on new values, outline the hovered municipality (assets/maps.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='maps', function_name='recolor'),
+    Output('education-map-graph', 'figure'),
+    [Input('education-map-values', 'data'),
+    Input('education-map-graph', 'hoverData')],
+    [State('education-map-base', 'data'),
+    State('education-map-graph', 'figure')]
+)
 
 @app.callback(
     Output('education-line-graph', 'figure'),
@@ -735,20 +633,18 @@ def update_map(selected_variable, selected_measure, selected_gender, selected_ag
     Input('education-color-memory', 'data'),
     ]
 )
+@line_cache.memoize
 def update_line_graph(selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, clickData, color):
-    dfs = df[(df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['variable'] == selected_variable)]
-
-    line_all = dfs[dfs['KOMKODE'] == 0]
+    line_all = cube.series(KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage)
     hele_danmark_color = 'rgb(242,146,12)'
     fig = go.Figure()
 
 
     ##### section for diff_* maps #####
     if selected_measure == 'diff_gender':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'woman') & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage)]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'man') & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage)]['observations'])
+        grp1, grp2 = cube.pair_series('gender', ('woman', 'man'), KOMKODE=0, variable=selected_variable, age=selected_age, heritage=selected_heritage)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 text=[f'Antal kvinder: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal mænd: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -761,11 +657,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'woman') & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage)]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'man') & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage)]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage)
+                grp1l, grp2l = cube.pair_series('gender', ('woman', 'man'), municipality=clickData[l], variable=selected_variable, age=selected_age, heritage=selected_heritage)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -778,10 +673,9 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                     "<extra></extra>"
                 ))
     elif selected_measure == 'diff_heritage':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == 'danish')]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == 'nonwestern')]['observations'])
+        grp1, grp2 = cube.pair_series('heritage', ('danish', 'nonwestern'), KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 text=[f'Antal danskere: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal ikke-vestlige indvandrere og efterkommere: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -794,11 +688,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == 'danish')]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == 'nonwestern')]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage)
+                grp1l, grp2l = cube.pair_series('heritage', ('danish', 'nonwestern'), municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -811,7 +704,7 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                     "<extra></extra>"
                 ))
     elif selected_measure == 'Gini' or selected_measure == 'Theil_L' or selected_measure == 'Theil_T' or selected_measure[1].isdigit():
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color), meta=line_all['observations'],
                                 hovertemplate=
                                 '<b>Hele Danmark</b><br>'+
@@ -823,11 +716,11 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage)
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
-                text=[f'{clickData[l]}' for _ in range(len(df['year'].unique()))],
+                text=[f'{clickData[l]}' for _ in range(len(cube.years))],
                 meta=dfl['observations'],
                 hovertemplate=
                 '<b>%{text}</b><br>'+
@@ -836,7 +729,7 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                 'Antal observationer: %{meta:,}'
                 "<extra></extra>"))
     else:
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color), meta=line_all['observations'],
                                 hovertemplate=
                                 '<b>Hele Danmark</b><br>'+
@@ -848,11 +741,11 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage)
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
-                text=[f'{clickData[l]}' for _ in range(len(df['year'].unique()))],
+                text=[f'{clickData[l]}' for _ in range(len(cube.years))],
                 meta=dfl['observations'],
                 hovertemplate=
                 '<b>%{text}</b><br>'+
@@ -922,22 +815,8 @@ def edu_download_map_csv():
     age = flask.request.args.get('age')
     heritage = flask.request.args.get('heritage')
     year = flask.request.args.get('year')
-    dff = df[(df['variable'] == variable) & (df['year'] == int(year)) & (df['gender'] == gender) & (df['age'] == age) & (df['heritage'] == heritage)].copy()
-    df_out = dff[['KOMKODE', 'observations', 'year', measure]]
-
-    str_io = io.StringIO()
-    df_out.to_csv(str_io, index=False, header=['kommunekode', 'antal observationer', 'aar', 'vaerdi'])
-
-    mem = io.BytesIO()
-    mem.write(str_io.getvalue().encode('utf-8'))
-    mem.seek(0)
-    str_io.close()
-    return flask.send_file(mem,
-                           mimetype='text/csv',
-                           attachment_filename='RFF-kort.csv',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    dff = cube.select(variable=variable, year=year, gender=gender, age=age, heritage=heritage)
+    return send_csv(dff, measure, 'RFF-kort.csv', 'education')
 
 @app.callback(
     Output('education-download-csv-series', 'href'),
@@ -974,75 +853,131 @@ def edu_download_series_csv():
     heritage = flask.request.args.get('heritage')
     municipalities = [int(m) for m in flask.request.args.getlist('municipalities')]
 
-    dff = df[(df['variable'] == variable) & (df['gender'] == gender) & (df['age'] == age) & (df['heritage'] == heritage) & (df['KOMKODE'].isin(municipalities))].copy()
-    df_out = dff[['KOMKODE', 'observations', 'year', measure]]
-
-    str_io = io.StringIO()
-    df_out.to_csv(str_io, index=False, header=['kommunekode', 'antal observationer', 'aar', 'vaerdi'])
-
-    mem = io.BytesIO()
-    mem.write(str_io.getvalue().encode('utf-8'))
-    mem.seek(0)
-    str_io.close()
-    return flask.send_file(mem,
-                           mimetype='text/csv',
-                           attachment_filename='RFF-serie.csv',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    dff = cube.select(variable=variable, gender=gender, age=age, heritage=heritage)
+    rows = np.flatnonzero(np.isin(dff['KOMKODE'].values, municipalities)) # positions in the slice, no filtered copy
+    return send_csv(dff, measure, 'RFF-serie.csv', 'education', rows)
 
 @app.callback(
-    Output('education-download-png-series', 'href'),
+    [Output('education-download-png-series', 'href'),
+     Output('education-download-svg-series', 'href'),
+     Output('education-download-pdf-series', 'href')],
     [Input('education-download-png-series-button', 'n_clicks'),
-     Input('education-line-graph', 'figure')]
- )
-def edu_link_download_series_image(click, fig):
-    if fig is None:
-        raise PreventUpdate
-    else:
-        img_bytes = plotly.io.to_image(fig, format='png', engine='kaleido') # img as bytes
-        out = base64.b64encode(img_bytes) # encoded
-        query_param = {'encoding': out}
-        query_string = urllib.parse.urlencode(query_param, doseq=True)
-        return f"/downloadEduSeriesImg?{query_string}"
+     Input('education-variable-selector', 'value'),
+     Input('education-measure-selector', 'value'),
+     Input('education-gender-selector', 'value'),
+     Input('education-age-selector', 'value'),
+     Input('education-heritage-selector', 'value'),
+     Input('education-memory', 'data'),
+     Input('education-color-memory', 'data')]
+)
+def edu_link_download_series_image(click, selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, municipalities, colors):
+    query_params = {'variable': selected_variable,
+                    'measure': selected_measure,
+                    'gender': selected_gender,
+                    'age': selected_age,
+                    'heritage': selected_heritage,
+                    'municipalities': municipalities or [],
+                    'colors': colors or [],
+                    }
+    query_string = urllib.parse.urlencode(query_params, doseq=True)
+    url = f"/downloadEduSeriesImg?{query_string}" # rendered when clicked, see edu_download_series_img
+    return url, url + '&format=svg', url + '&format=pdf'
 
 @app.server.route('/downloadEduSeriesImg')
 def edu_download_series_img():
-    encoding = flask.request.args.get('encoding').encode('utf-8') # load as string and encode to bytes
-    decoded = base64.b64decode(encoding)
-    img_io = io.BytesIO(decoded)
-    img_io.seek(0)
-    return flask.send_file(img_io,
-                           mimetype='image/png',
-                           attachment_filename='RFF-serie.png',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    variable = flask.request.args.get('variable')
+    measure = flask.request.args.get('measure')
+    gender = flask.request.args.get('gender')
+    age = flask.request.args.get('age')
+    heritage = flask.request.args.get('heritage')
+    municipalities = flask.request.args.getlist('municipalities') or None
+    colors = flask.request.args.getlist('colors') or None
+    format = flask.request.args.get('format', 'png')
+    if format not in IMAGE_FORMATS:
+        flask.abort(400)
+    check_selection(cube, measure, municipalities=municipalities, colors=colors, variable=variable, gender=gender, age=age, heritage=heritage)
+    # the memoized callback, i.e. the figure on screen
+    fig = update_line_graph.__wrapped__(variable, measure, gender, age, heritage, municipalities, colors)
+    return send_artifact(render_image(fig, format), IMAGE_FORMATS[format], f'RFF-serie.{format}')
 
 @app.callback(
-    Output('education-download-png-map', 'href'),
+    [Output('education-download-png-map', 'href'),
+     Output('education-download-svg-map', 'href'),
+     Output('education-download-pdf-map', 'href')],
     [Input('education-download-png-map-button', 'n_clicks'),
-     Input('education-map-graph', 'figure')]
- )
-def edu_link_download_map_image(click, fig):
-    if fig is None:
-        raise PreventUpdate
-    else:
-        img_bytes = plotly.io.to_image(fig, format='png', engine='kaleido') # img as bytes
-        out = base64.b64encode(img_bytes) # encoded
-        query_param = {'encoding': out}
-        query_string = urllib.parse.urlencode(query_param, doseq=True)
-        return f"/downloadEduMapImg?{query_string}"
+     Input('education-variable-selector', 'value'),
+     Input('education-measure-selector', 'value'),
+     Input('education-gender-selector', 'value'),
+     Input('education-age-selector', 'value'),
+     Input('education-heritage-selector', 'value'),
+     Input('education-year-selector', 'value')]
+)
+def edu_link_download_map_image(click, selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_year):
+    query_params = {'variable': selected_variable,
+                    'measure': selected_measure,
+                    'gender': selected_gender,
+                    'age': selected_age,
+                    'heritage': selected_heritage,
+                    'year': selected_year
+                    }
+    query_string = urllib.parse.urlencode(query_params, doseq=True)
+    url = f"/downloadEduMapImg?{query_string}" # rendered when clicked, see edu_download_map_img
+    return url, url + '&format=svg', url + '&format=pdf'
 
 @app.server.route('/downloadEduMapImg')
 def edu_download_map_img():
-    encoding = flask.request.args.get('encoding').encode('utf-8') # load as string and encode to bytes
-    decoded = base64.b64decode(encoding)
-    img_io = io.BytesIO(decoded)
-    img_io.seek(0)
-    return flask.send_file(img_io,
-                           mimetype='image/png',
-                           attachment_filename='RFF-kort.png',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    variable = flask.request.args.get('variable')
+    measure = flask.request.args.get('measure')
+    gender = flask.request.args.get('gender')
+    age = flask.request.args.get('age')
+    heritage = flask.request.args.get('heritage')
+    year = flask.request.args.get('year')
+    format = flask.request.args.get('format', 'png')
+    if format not in IMAGE_FORMATS:
+        flask.abort(400)
+    check_selection(cube, measure, years=[year], variable=variable, gender=gender, age=age, heritage=heritage)
+    payload = update_map.__wrapped__(variable, measure, gender, age, heritage, year) # the memoized callback
+    fig = inline_geometry(map_figure(payload), EXPORT_LEVELS[format]) # less detail for vectors
+    return send_artifact(render_image(fig, format), IMAGE_FORMATS[format], f'RFF-kort.{format}')
+
+@app.callback(
+    [Output('education-download-zip-map', 'href'),
+     Output('education-download-gif-map', 'href')],
+    [Input('education-variable-selector', 'value'),
+     Input('education-measure-selector', 'value'),
+     Input('education-gender-selector', 'value'),
+     Input('education-age-selector', 'value'),
+     Input('education-heritage-selector', 'value')]
+)
+def edu_link_download_map_years(selected_variable, selected_measure, selected_gender, selected_age, selected_heritage):
+    query_params = {'variable': selected_variable,
+                    'measure': selected_measure,
+                    'gender': selected_gender,
+                    'age': selected_age,
+                    'heritage': selected_heritage,
+                    }
+    query_string = urllib.parse.urlencode(query_params, doseq=True)
+    return f"/downloadEduMapYears?{query_string}&format=zip", f"/downloadEduMapYears?{query_string}&format=gif"
+
+@app.server.route('/downloadEduMapYears')
+def edu_download_map_years():
+    """
+    Every year of the map selection, as zip of PNGs or as animated GIF (smaller
+    thumb geometry). Frames are rendered in parallel and cached like single maps.
+    """
+    variable = flask.request.args.get('variable')
+    measure = flask.request.args.get('measure')
+    gender = flask.request.args.get('gender')
+    age = flask.request.args.get('age')
+    heritage = flask.request.args.get('heritage')
+    format = flask.request.args.get('format')
+    if format not in ('zip', 'gif'):
+        flask.abort(400, 'format must be zip or gif')
+    animation = format == 'gif'
+    check_selection(cube, measure, variable=variable, gender=gender, age=age, heritage=heritage)
+    figs = [inline_geometry(map_figure(update_map.__wrapped__(variable, measure, gender, age, heritage, year)), 'thumb' if animation else 'png') for year in cube.years]
+    frames = render_many(figs)
+    if animation:
+        return send_artifact(animated_gif(frames), 'image/gif', 'RFF-kort.gif')
+    files = {f'RFF-kort-{year}.png': frame for year, frame in zip(cube.years, frames)}
+    return send_artifact(zip_files(files), 'application/zip', 'RFF-kort.zip')
@@ -1,16 +1,10 @@
-import io
-import json
 import urllib
-import base64
 from decimal import Decimal
 import numpy as np
-import pandas as pd
-import plotly
-import plotly.express as px
 import plotly.graph_objects as go
 import flask
 import dash
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
@@ -18,10 +12,15 @@ from dash.exceptions import PreventUpdate
 
 ### import functions from directories ###
 from ineq_app import app
+from data import get_komkoder, get_cube, get_hash
+from cache import FigureCache, DiskCache
+from maps import map_payload, map_base, map_figure, inline_geometry, EXPORT_LEVELS
+from images import render_image, render_many, zip_files, animated_gif, IMAGE_FORMATS
+from artifacts import send_artifact
+from downloads import send_csv, check_selection
 from utils import(
     navigation2,
     top_banner,
-    path2file,
     encode_svg,
     labels_dict,
     RF_orange,
@@ -31,17 +30,11 @@ from utils import(
 )
 
 ### load in data ###
-with open(path2file('kommuner4.geojson')) as geo:
-    geojson = json.load(geo)
-with open(path2file('kommune_koder.json'), encoding='utf-8') as komk:
-    komkoder  = json.load(komk)
-komkoder2str = {int(k): str(v) for k, v in komkoder.items()}
-komstr2koder = {str(v): int(k) for k, v in komkoder.items()}
-
-# pd.options.display.float_format = '{:.3f}'.format
-df = pd.read_csv(path2file('health.csv'))
-df = df.astype({'KOMKODE':'int', 'year':'int'}) # ensure correct type
-df = df.sort_values(by=['year', 'KOMKODE'])
+komkoder2str, komstr2koder = get_komkoder()
+cube = get_cube('health')
+map_cache = FigureCache() # map payloads by selector tuple
+# finished line graphs by selector tuple, in memory and on disk for all workers
+line_cache = FigureCache(disk=DiskCache('health-line', get_hash('health')))
 
 health_icon = encode_svg('health_dark.svg')
 health_icon_active = encode_svg('health_orange.svg')
@@ -146,7 +139,7 @@ controls = dbc.Container([
             html.Div(
                 dbc.Select(
                     id='health-year-selector',
-                    options=[{'label': y, 'value': y} for y in df['year'].unique()],
+                    options=[{'label': y, 'value': y} for y in cube.years],
                     value=2018,
                 )
             ),
@@ -174,6 +167,8 @@ layout = html.Div([
     html.Div([navigation2()]),
     html.Div(dcc.Store(id='health-memory')), # reverts to default on every page refresh
     html.Div(dcc.Store(id='health-color-memory')), # reverts to default on every page refresh
+    html.Div(dcc.Store(id='health-map-values')), # map payload of the selection, drawn by assets/maps.js
+    html.Div(dcc.Store(id='health-map-base', data=map_base())), # geometry URL, layout and names for the maps
     html.Div([dbc.Fade(
         controls, id='health-control-fade', is_in=False, style={"transition": "opacity 200ms ease"}
     )
@@ -618,7 +613,7 @@ def click_list(clickData, data):
     return data
 
 @app.callback(
-    Output('health-map-graph', 'figure'),
+    Output('health-map-values', 'data'),
     [Input('health-variable-selector', 'value'),
     Input('health-measure-selector', 'value'),
     Input('health-gender-selector', 'value'),
@@ -628,240 +623,112 @@ def click_list(clickData, data):
     Input('health-labor-selector', 'value'),
     Input('health-year-selector', 'value')]
 )
+@map_cache.memoize
 def update_map(selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor, selected_year):
-    dfs = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)].copy()
-    dfs.dropna(axis=0, subset=[selected_measure], inplace=True)
-    colorscale_level = ['rgb(244,230,211)', 'rgb(244,190,117)', 'rgb(242,146,12)', 'rgb(219,126,15)', 'rgb(196,105,18)', 'rgb(162,75,23)', 'rgb(102,21,32)', 'rgb(51,11,16)']
-
-    rdf = pd.DataFrame(columns=['KOMKODE','val', 'municipality'])
-    ### Get missing kommuner ###
-    missing_mun_list = []
-    for k in komkoder2str.keys():
-        if k not in dfs['KOMKODE'].unique():
-            missing_mun_list.append(k)
-            rdf = rdf.append({'KOMKODE':k, 'municipality':komkoder2str.get(k), 'val':'missing'}, ignore_index=True)
-
+    dfs = cube.map(selected_measure, selected_year, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
     if selected_measure == 'diff_education':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == 'low') & (df['labor'] == selected_labor)]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == 'high') & (df['labor'] == selected_labor)]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'Antal'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal uden videregående udd.: %{customdata[2]:,}<br>" +\
-                "Antal med videregående udd.: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('education', ('low', 'high'), selected_year, dfs['KOMKODE'], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, labor=selected_labor)
+        diverging = True
+        colorbar_title = 'Antal'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal uden videregående udd.: %{customdata[2]:,}<br>" +\
+            "Antal med videregående udd.: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at dem med videregående uddannelse har dårligere sundhed)'
     elif selected_measure == 'diff_labor':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'unskilled')]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'skilled')]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'Antal'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal m. grundskole som højest fuldførte udd.: %{customdata[2]:,}<br>" +\
-                "Antal m. højere udd. end grundskole: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('labor', ('unskilled', 'skilled'), selected_year, dfs['KOMKODE'], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education)
+        diverging = True
+        colorbar_title = 'Antal'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal m. grundskole som højest fuldførte udd.: %{customdata[2]:,}<br>" +\
+            "Antal m. højere udd. end grundskole: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at dem m. højere udd. end grundskole har dårligere sundhed)'
     elif selected_measure == 'diff_gender':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == 'woman') & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == 'man') & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'Antal'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal kvinder: %{customdata[2]:,}<br>" +\
-                "Antal mænd: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('gender', ('woman', 'man'), selected_year, dfs['KOMKODE'], variable=selected_variable, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+        diverging = True
+        colorbar_title = 'Antal'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal kvinder: %{customdata[2]:,}<br>" +\
+            "Antal mænd: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at mænd har dårligere sundhed)'
     elif selected_measure == 'diff_heritage':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == 'danish') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == 'nonwestern') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'Antal'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal danskere: %{customdata[2]:,}<br>" +\
-                "Antal ikke-vestlige indvandrere og efterkommere: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('heritage', ('danish', 'nonwestern'), selected_year, dfs['KOMKODE'], variable=selected_variable, gender=selected_gender, age=selected_age, education=selected_education, labor=selected_labor)
+        diverging = True
+        colorbar_title = 'Antal'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal danskere: %{customdata[2]:,}<br>" +\
+            "Antal ikke-vestlige indvandrere og efterkommere: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at danskere har dårligere sundhed)'
     elif selected_measure == 'Gini' or selected_measure.startswith('Theil_') or selected_measure[1].isdigit():
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: ''},
-                            # color_continuous_midpoint=np.mean(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.4f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = ''
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.4f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
     elif (selected_variable == 'copd' or selected_variable == 't2diabetes') and (selected_measure == 'mean'):
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'Procent'},
-                            # color_continuous_midpoint=np.median(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = 'Procent'
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
     elif selected_measure == 'mean':
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'Antal'},
-                            # color_continuous_midpoint=np.median(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = 'Antal'
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
 
     else:
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: ''},
-                            # color_continuous_midpoint=np.median(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = ''
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
 
-    fig.update_geos(fitbounds="locations", visible=False)
-    fig.update_layout(
-        font_family='Avenir Next',
-        # title_text='Hello world',
-        # width=1000,
-        # height=600,
-        margin={"r":0,"t":0,"l":0,"b":0},
-        font_size=12,
-        coloraxis_colorbar_tickformat='',
-        separators=",..",
-        autosize=True,
-        coloraxis=dict(
-            colorbar_x=-0.05
-        ),
-    )
-
-    ##### Add square around Bornholm #####
-    factorx = 0.1
-    factory = 0.065
-    x = [12.682574-factorx, 12.682574-factorx, 13.193236+factorx, 13.193236+factorx, 12.682574-factorx]
-    y = [56.986583-factory, 57.323286+factory, 57.323286+factory, 56.986583-factory, 56.986583-factory]
-    Bsquare = px.line_geo(lat=y, lon=x, projection='mercator',  color_discrete_sequence=['rgb(0,0,0)']*5)
-    Bsquare.data[0].showlegend=False
-    Bsquare.update_traces(
-       hovertemplate=None,
-       hoverinfo='skip'
-    )
-    fig.add_trace(Bsquare.data[0])
+    tickformat = ''
     anno_text1 = f'År: {selected_year}'
     if 'anno_text2' not in locals():
             anno_text2 = ''
     anno_text_final = '<br>'.join(filter(None, [anno_text1, anno_text2]))
-    fig.add_annotation(x=0.5, y=0, text=anno_text_final, showarrow=False)
-
-    if len(rdf) > 0: # if some municipalities are missing
-        missing_map = px.choropleth(rdf, geojson=geojson, color="val",
-                            locations="KOMKODE", featureidkey="properties.KOMKODE",
-                            projection="mercator", color_discrete_map={'missing':'gray'},
-                           )
-        missing_map.data[0].showlegend=False
-        missing_map.update_traces(
-            customdata= np.stack((rdf['municipality'], rdf['val']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Få observationer" + \
-                "<extra></extra>"
-            )
-        )
+    return map_payload(dfs['KOMKODE'], dfs[selected_measure], observations, hovertemplate,
+                       diverging=diverging, colorbar_title=colorbar_title, tickformat=tickformat, annotation=anno_text_final)
 
-        fig.add_trace(missing_map.data[0])
-    return fig
+# recolor on new values, outline the hovered municipality (assets/maps.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='maps', function_name='recolor'),
+    Output('health-map-graph', 'figure'),
+    [Input('health-map-values', 'data'),
+    Input('health-map-graph', 'hoverData')],
+    [State('health-map-base', 'data'),
+    State('health-map-graph', 'figure')]
+)
 @app.callback(
     Output('health-line-graph', 'figure'),
     [
@@ -876,20 +743,18 @@ def update_map(selected_variable, selected_measure, selected_gender, selected_ag
     Input('health-color-memory', 'data'),
     ]
 )
+@line_cache.memoize
 def update_line_graph(selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor, clickData, color):
-    dfs = df[(df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor) & (df['variable'] == selected_variable)]
-
-    line_all = dfs[dfs['KOMKODE'] == 0]
+    line_all = cube.series(KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
     hele_danmark_color = 'rgb(242,146,12)'
     fig = go.Figure()
 
 
     ##### section for diff_* maps #####
     if selected_measure == 'diff_education':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == 'low') & (df['labor'] == selected_labor)]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == 'high') & (df['labor'] == selected_labor)]['observations'])
+        grp1, grp2 = cube.pair_series('education', ('low', 'high'), KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, labor=selected_labor)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 meta=[f'Antal uden videregående udd.: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal med videregående udd.: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -902,11 +767,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == 'low') & (df['labor'] == selected_labor)]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == 'high') & (df['labor'] == selected_labor)]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                grp1l, grp2l = cube.pair_series('education', ('low', 'high'), municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, labor=selected_labor)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -920,10 +784,9 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                 ))
 
     elif selected_measure == 'diff_labor':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'unskilled')]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'skilled')]['observations'])
+        grp1, grp2 = cube.pair_series('labor', ('unskilled', 'skilled'), KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 text=[f'Antal m. grundskole som højest fuldførte udd.: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal m. højere udd. end grundskole: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -936,11 +799,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'unskilled')]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'skilled')]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                grp1l, grp2l = cube.pair_series('labor', ('unskilled', 'skilled'), municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -953,10 +815,9 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                     "<extra></extra>"
                 ))
     elif selected_measure == 'diff_gender':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'woman') & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'man') & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
+        grp1, grp2 = cube.pair_series('gender', ('woman', 'man'), KOMKODE=0, variable=selected_variable, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 text=[f'Antal kvinder: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal mænd: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -969,11 +830,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'woman') & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'man') & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                grp1l, grp2l = cube.pair_series('gender', ('woman', 'man'), municipality=clickData[l], variable=selected_variable, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -986,10 +846,9 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                     "<extra></extra>"
                 ))
     elif selected_measure == 'diff_heritage':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == 'danish') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == 'nonwestern') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
+        grp1, grp2 = cube.pair_series('heritage', ('danish', 'nonwestern'), KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age, education=selected_education, labor=selected_labor)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 text=[f'Antal danskere: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal ikke-vestlige indvandrere og efterkommere: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -1002,11 +861,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == 'danish') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == 'nonwestern') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                grp1l, grp2l = cube.pair_series('heritage', ('danish', 'nonwestern'), municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, education=selected_education, labor=selected_labor)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -1019,7 +877,7 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                     "<extra></extra>"
                 ))
     elif selected_measure == 'Gini' or selected_measure == 'Theil_L' or selected_measure == 'Theil_T' or selected_measure[1].isdigit():
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color), meta=line_all['observations'],
                                 hovertemplate=
                                 '<b>Hele Danmark</b><br>'+
@@ -1031,11 +889,11 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
-                text=[f'{clickData[l]}' for _ in range(len(df['year'].unique()))],
+                text=[f'{clickData[l]}' for _ in range(len(cube.years))],
                 meta=dfl['observations'],
                 hovertemplate=
                 '<b>%{text}</b><br>'+
@@ -1044,7 +902,7 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                 'Antal observationer: %{meta:,}'
                 "<extra></extra>"))
     else:
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color), meta=line_all['observations'],
                                 hovertemplate=
                                 '<b>Hele Danmark</b><br>'+
@@ -1056,11 +914,11 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
-                text=[f'{clickData[l]}' for _ in range(len(df['year'].unique()))],
+                text=[f'{clickData[l]}' for _ in range(len(cube.years))],
                 meta=dfl['observations'],
                 hovertemplate=
                 '<b>%{text}</b><br>'+
@@ -1143,22 +1001,8 @@ def health_download_map_csv():
     education = flask.request.args.get('education')
     labor = flask.request.args.get('labor')
     year = flask.request.args.get('year')
-    dff = df[(df['variable'] == variable) & (df['year'] == int(year)) & (df['gender'] == gender) & (df['age'] == age) & (df['heritage'] == heritage) & (df['education'] == education) & (df['labor'] == labor)].copy()
-    df_out = dff[['KOMKODE', 'observations', 'year', measure]]
-
-    str_io = io.StringIO()
-    df_out.to_csv(str_io, index=False, header=['kommunekode', 'antal observationer', 'aar', 'vaerdi'])
-
-    mem = io.BytesIO()
-    mem.write(str_io.getvalue().encode('utf-8'))
-    mem.seek(0)
-    str_io.close()
-    return flask.send_file(mem,
-                           mimetype='text/csv',
-                           attachment_filename='RFF-kort.csv',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    dff = cube.select(variable=variable, year=year, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    return send_csv(dff, measure, 'RFF-kort.csv', 'health')
 
 @app.callback(
     Output('health-download-csv-series', 'href'),
@@ -1201,78 +1045,152 @@ def health_download_series_csv():
     labor = flask.request.args.get('labor')
     municipalities = [int(m) for m in flask.request.args.getlist('municipalities')]
 
-    dff = df[(df['variable'] == variable) & (df['gender'] == gender) & (df['age'] == age) & (df['heritage'] == heritage) & (df['education'] == education) & (df['labor'] == labor) & (df['KOMKODE'].isin(municipalities))].copy()
-    df_out = dff[['KOMKODE', 'observations', 'year', measure]]
-
-    str_io = io.StringIO()
-    df_out.to_csv(str_io, index=False, header=['kommunekode', 'antal observationer', 'aar', 'vaerdi'])
-
-    mem = io.BytesIO()
-    mem.write(str_io.getvalue().encode('utf-8'))
-    mem.seek(0)
-    str_io.close()
-    return flask.send_file(mem,
-                           mimetype='text/csv',
-                           attachment_filename='RFF-serie.csv',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    dff = cube.select(variable=variable, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    rows = np.flatnonzero(np.isin(dff['KOMKODE'].values, municipalities)) # positions in the slice, no filtered copy
+    return send_csv(dff, measure, 'RFF-serie.csv', 'health', rows)
 
 @app.callback(
-    Output('health-download-png-series', 'href'),
+    [Output('health-download-png-series', 'href'),
+     Output('health-download-svg-series', 'href'),
+     Output('health-download-pdf-series', 'href')],
     [Input('health-download-png-series-button', 'n_clicks'),
-     Input('health-line-graph', 'figure')]
- )
-def health_link_download_series_image(click, fig):
-    if fig is None:
-        raise PreventUpdate
-    else:
-        img_bytes = plotly.io.to_image(fig, format='png', engine='kaleido') # img as bytes
-        out = base64.b64encode(img_bytes) # encoded
-        query_param = {'encoding': out}
-        query_string = urllib.parse.urlencode(query_param, doseq=True)
-        return f"/downloadHealthSeriesImg?{query_string}"
+     Input('health-variable-selector', 'value'),
+     Input('health-measure-selector', 'value'),
+     Input('health-gender-selector', 'value'),
+     Input('health-age-selector', 'value'),
+     Input('health-heritage-selector', 'value'),
+     Input('health-education-selector', 'value'),
+     Input('health-labor-selector', 'value'),
+     Input('health-memory', 'data'),
+     Input('health-color-memory', 'data')]
+)
+def health_link_download_series_image(click, selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor, municipalities, colors):
+    query_params = {'variable': selected_variable,
+                    'measure': selected_measure,
+                    'gender': selected_gender,
+                    'age': selected_age,
+                    'heritage': selected_heritage,
+                    'education': selected_education,
+                    'labor': selected_labor,
+                    'municipalities': municipalities or [],
+                    'colors': colors or [],
+                    }
+    query_string = urllib.parse.urlencode(query_params, doseq=True)
+    url = f"/downloadHealthSeriesImg?{query_string}" # rendered when clicked, see health_download_series_img
+    return url, url + '&format=svg', url + '&format=pdf'
 
 @app.server.route('/downloadHealthSeriesImg')
 def health_download_series_img():
-    encoding = flask.request.args.get('encoding').encode('utf-8') # load as string and encode to bytes
-    decoded = base64.b64decode(encoding)
-    img_io = io.BytesIO(decoded)
-    img_io.seek(0)
-    return flask.send_file(img_io,
-                           mimetype='image/png',
-                           attachment_filename='RFF-serie.png',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    variable = flask.request.args.get('variable')
+    measure = flask.request.args.get('measure')
+    gender = flask.request.args.get('gender')
+    age = flask.request.args.get('age')
+    heritage = flask.request.args.get('heritage')
+    education = flask.request.args.get('education')
+    labor = flask.request.args.get('labor')
+    municipalities = flask.request.args.getlist('municipalities') or None
+    colors = flask.request.args.getlist('colors') or None
+    format = flask.request.args.get('format', 'png')
+    if format not in IMAGE_FORMATS:
+        flask.abort(400)
+    check_selection(cube, measure, municipalities=municipalities, colors=colors, variable=variable, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    # the memoized callback, i.e. the figure on screen
+    fig = update_line_graph.__wrapped__(variable, measure, gender, age, heritage, education, labor, municipalities, colors)
+    return send_artifact(render_image(fig, format), IMAGE_FORMATS[format], f'RFF-serie.{format}')
 
 @app.callback(
-    Output('health-download-png-map', 'href'),
+    [Output('health-download-png-map', 'href'),
+     Output('health-download-svg-map', 'href'),
+     Output('health-download-pdf-map', 'href')],
     [Input('health-download-png-map-button', 'n_clicks'),
-     Input('health-map-graph', 'figure')]
- )
-def health_link_download_map_image(click, fig):
-    if fig is None:
-        raise PreventUpdate
-    else:
-        img_bytes = plotly.io.to_image(fig, format='png', engine='kaleido') # img as bytes
-        out = base64.b64encode(img_bytes) # encoded
-        query_param = {'encoding': out}
-        query_string = urllib.parse.urlencode(query_param, doseq=True)
-        return f"/downloadHealthMapImg?{query_string}"
+     Input('health-variable-selector', 'value'),
+     Input('health-measure-selector', 'value'),
+     Input('health-gender-selector', 'value'),
+     Input('health-age-selector', 'value'),
+     Input('health-heritage-selector', 'value'),
+     Input('health-education-selector', 'value'),
+     Input('health-labor-selector', 'value'),
+     Input('health-year-selector', 'value')]
+)
+def health_link_download_map_image(click, selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor, selected_year):
+    query_params = {'variable': selected_variable,
+                    'measure': selected_measure,
+                    'gender': selected_gender,
+                    'age': selected_age,
+                    'heritage': selected_heritage,
+                    'education': selected_education,
+                    'labor': selected_labor,
+                    'year': selected_year
+                    }
+    query_string = urllib.parse.urlencode(query_params, doseq=True)
+    url = f"/downloadHealthMapImg?{query_string}" # rendered when clicked, see health_download_map_img
+    return url, url + '&format=svg', url + '&format=pdf'
 
 @app.server.route('/downloadHealthMapImg')
 def health_download_map_img():
-    encoding = flask.request.args.get('encoding').encode('utf-8') # load as string and encode to bytes
-    decoded = base64.b64decode(encoding)
-    img_io = io.BytesIO(decoded)
-    img_io.seek(0)
-    return flask.send_file(img_io,
-                           mimetype='image/png',
-                           attachment_filename='RFF-kort.png',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    variable = flask.request.args.get('variable')
+    measure = flask.request.args.get('measure')
+    gender = flask.request.args.get('gender')
+    age = flask.request.args.get('age')
+    heritage = flask.request.args.get('heritage')
+    education = flask.request.args.get('education')
+    labor = flask.request.args.get('labor')
+    year = flask.request.args.get('year')
+    format = flask.request.args.get('format', 'png')
+    if format not in IMAGE_FORMATS:
+        flask.abort(400)
+    check_selection(cube, measure, years=[year], variable=variable, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    payload = update_map.__wrapped__(variable, measure, gender, age, heritage, education, labor, year) # the memoized callback
+    fig = inline_geometry(map_figure(payload), EXPORT_LEVELS[format]) # less detail for vectors
+    return send_artifact(render_image(fig, format), IMAGE_FORMATS[format], f'RFF-kort.{format}')
+
+@app.callback(
+    [Output('health-download-zip-map', 'href'),
+     Output('health-download-gif-map', 'href')],
+    [Input('health-variable-selector', 'value'),
+     Input('health-measure-selector', 'value'),
+     Input('health-gender-selector', 'value'),
+     Input('health-age-selector', 'value'),
+     Input('health-heritage-selector', 'value'),
+     Input('health-education-selector', 'value'),
+     Input('health-labor-selector', 'value')]
+)
+def health_link_download_map_years(selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor):
+    query_params = {'variable': selected_variable,
+                    'measure': selected_measure,
+                    'gender': selected_gender,
+                    'age': selected_age,
+                    'heritage': selected_heritage,
+                    'education': selected_education,
+                    'labor': selected_labor,
+                    }
+    query_string = urllib.parse.urlencode(query_params, doseq=True)
+    return f"/downloadHealthMapYears?{query_string}&format=zip", f"/downloadHealthMapYears?{query_string}&format=gif"
+
+@app.server.route('/downloadHealthMapYears')
+def health_download_map_years():
+    """
+    Every year of the map selection, as zip of PNGs or as animated GIF (smaller
+    thumb geometry). Frames are rendered in parallel and cached like single maps.
+    """
+    variable = flask.request.args.get('variable')
+    measure = flask.request.args.get('measure')
+    gender = flask.request.args.get('gender')
+    age = flask.request.args.get('age')
+    heritage = flask.request.args.get('heritage')
+    education = flask.request.args.get('education')
+    labor = flask.request.args.get('labor')
+    format = flask.request.args.get('format')
+    if format not in ('zip', 'gif'):
+        flask.abort(400, 'format must be zip or gif')
+    animation = format == 'gif'
+    check_selection(cube, measure, variable=variable, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    figs = [inline_geometry(map_figure(update_map.__wrapped__(variable, measure, gender, age, heritage, education, labor, year)), 'thumb' if animation else 'png') for year in cube.years]
+    frames = render_many(figs)
+    if animation:
+        return send_artifact(animated_gif(frames), 'image/gif', 'RFF-kort.gif')
+    files = {f'RFF-kort-{year}.png': frame for year, frame in zip(cube.years, frames)}
+    return send_artifact(zip_files(files), 'application/zip', 'RFF-kort.zip')
 
 
 # print(px.colors.sequential.RdBu_r)
@@ -1,15 +1,9 @@
-import io
-import json
 import urllib
-import base64
 import numpy as np
-import pandas as pd
-import plotly
-import plotly.express as px
 import plotly.graph_objects as go
 import flask
 import dash
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
@@ -17,32 +11,29 @@ from dash.exceptions import PreventUpdate
 
 ### import functions from directories ###
 from ineq_app import app
+from data import get_komkoder, get_cube, get_hash
+from cache import FigureCache, DiskCache
+from maps import map_payload, map_base, map_figure, inline_geometry, EXPORT_LEVELS
+from images import render_image, render_many, zip_files, animated_gif, IMAGE_FORMATS
+from artifacts import send_artifact
+from downloads import send_csv, check_selection
 from utils import(
     navigation2,
     top_banner,
-    path2file,
     encode_svg,
     labels_dict,
     RF_orange,
     RF_gray,
     download_dropdown,
     button_help,
-    # get_highlights,
-    # get_coordinates
 )
 
 ### load in data ###
-with open(path2file('kommuner4.geojson')) as geo:
-    geojson = json.load(geo)
-# district_lookup = {feature['properties']['KOMKODE']: feature for feature in geojson['features']} # dict for kommuner with KOMKODE as key and coordinates as value
-with open(path2file('kommune_koder.json'), encoding='utf-8') as komk:
-    komkoder  = json.load(komk)
-komkoder2str = {int(k): str(v) for k, v in komkoder.items()}
-komstr2koder = {str(v): int(k) for k, v in komkoder.items()}
-
-df = pd.read_csv(path2file('income.csv'))
-df = df.astype({'KOMKODE':'int', 'year':'int'}) # ensure correct type
-df = df.sort_values(by=['year', 'KOMKODE'])
+komkoder2str, komstr2koder = get_komkoder()
+cube = get_cube('income')
+map_cache = FigureCache() # map payloads by selector tuple
+# finished line graphs by selector tuple, in memory and on disk for all workers
+line_cache = FigureCache(disk=DiskCache('income-line', get_hash('income')))
 
 income_icon = encode_svg('inc_dark.svg')
 income_icon_active = encode_svg('inc_orange.svg')
@@ -136,7 +127,7 @@ controls = dbc.Container([
             html.Div(
                 dbc.Select(
                     id='income-year-selector',
-                    options=[{'label': y, 'value': y} for y in df['year'].unique()],
+                    options=[{'label': y, 'value': y} for y in cube.years],
                     value=2018,
                 )
             ),
@@ -164,6 +155,8 @@ layout = html.Div([
     html.Div([navigation2()]),
     html.Div(dcc.Store(id='income-memory')), # reverts to default on every page refresh
     html.Div(dcc.Store(id='income-color-memory')), # reverts to default on every page refresh
+    html.Div(dcc.Store(id='income-map-values')), # map payload of the selection, drawn by assets/maps.js
+    html.Div(dcc.Store(id='income-map-base', data=map_base())), # geometry URL, layout and names for the maps
     html.Div([dbc.Fade(
         controls, id='income-control-fade', is_in=False, style={"transition": "opacity 200ms ease"}
     )
@@ -615,36 +608,8 @@ def click_list(clickData, data):
 
 ##### Begin plotting graphs #####
 
-# @app.callback(
-#     Output('income-map-graph', 'figure'),
-#     [Input('income-map-graph', 'hoverData')],
-#     [State('income-map-graph', 'figure')]
-# )
-# def display_hover_data(hoverData, fig):
-#     ### NOTE:  cannot have multiple output for same id property. Including in the definition of the figure does not work
-#     if hoverData is None:
-#         raise PreventUpdate
-#     else:
-#         l, x, y = get_coordinates(
-#             kom = komstr2koder[hoverData['points'][0]['customdata'][0]],
-#             d = district_lookup
-#         )
-#
-#         if l > 1:
-#             for i in range(l):
-#                 line = px.line_geo(lat=y[i], lon=x[i], projection='mercator',  color_discrete_sequence=['rgb(0,0,0)']*len(x))
-#                 line.data[0].showlegend=False
-#                 line.update_traces(
-#                    hovertemplate=None,
-#                    hoverinfo='skip'
-#                 )
-#                 fig.add_trace(line.data[0])
-#         else:
-#             raise PreventUpdate
-#     return fig
-
 @app.callback(
-    Output('income-map-graph', 'figure'),
+    Output('income-map-values', 'data'),
     [Input('income-variable-selector', 'value'),
     Input('income-measure-selector', 'value'),
     Input('income-gender-selector', 'value'),
@@ -654,227 +619,106 @@ def click_list(clickData, data):
     Input('income-labor-selector', 'value'),
     Input('income-year-selector', 'value')]
 )
+@map_cache.memoize
 def update_map(selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor, selected_year):
-    dfs = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)].copy()
-    dfs.dropna(axis=0, subset=[selected_measure], inplace=True)
-    colorscale_level = ['rgb(244,230,211)', 'rgb(244,190,117)', 'rgb(242,146,12)', 'rgb(219,126,15)', 'rgb(196,105,18)', 'rgb(162,75,23)', 'rgb(102,21,32)', 'rgb(51,11,16)']
-
-    rdf = pd.DataFrame(columns=['KOMKODE','val', 'municipality'])
-    ### Get missing kommuner ###
-    missing_mun_list = []
-    for k in komkoder2str.keys():
-        if k not in dfs['KOMKODE'].unique():
-            missing_mun_list.append(k)
-            rdf = rdf.append({'KOMKODE':k, 'municipality':komkoder2str.get(k), 'val':'missing'}, ignore_index=True)
-
+    dfs = cube.map(selected_measure, selected_year, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
     if selected_measure == 'diff_education':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == 'low') & (df['labor'] == selected_labor)]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == 'high') & (df['labor'] == selected_labor)]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'DKK'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.0f}<br>" +\
-                "Antal uden videregående udd.: %{customdata[2]:,}<br>" +\
-                "Antal med videregående udd.: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('education', ('low', 'high'), selected_year, dfs['KOMKODE'], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, labor=selected_labor)
+        diverging = True
+        colorbar_title = 'DKK'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.0f}<br>" +\
+            "Antal uden videregående udd.: %{customdata[2]:,}<br>" +\
+            "Antal med videregående udd.: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at dem med videregående uddannelse har en højere indkomst)'
     elif selected_measure == 'diff_labor':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'unskilled')]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'skilled')]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'DKK'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.0f}<br>" +\
-                "Antal m. grundskole som højest fuldførte udd.: %{customdata[2]:,}<br>" +\
-                "Antal m. højere udd. end grundskole: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('labor', ('unskilled', 'skilled'), selected_year, dfs['KOMKODE'], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education)
+        diverging = True
+        colorbar_title = 'DKK'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.0f}<br>" +\
+            "Antal m. grundskole som højest fuldførte udd.: %{customdata[2]:,}<br>" +\
+            "Antal m. højere udd. end grundskole: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at dem m. højere udd. end grundskole har en højere indkomst)'
     elif selected_measure == 'diff_gender':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == 'woman') & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == 'man') & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'DKK'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.0f}<br>" +\
-                "Antal kvinder: %{customdata[2]:,}<br>" +\
-                "Antal mænd: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('gender', ('woman', 'man'), selected_year, dfs['KOMKODE'], variable=selected_variable, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+        diverging = True
+        colorbar_title = 'DKK'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.0f}<br>" +\
+            "Antal kvinder: %{customdata[2]:,}<br>" +\
+            "Antal mænd: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at mænd har en højere indkomst)'
     elif selected_measure == 'diff_heritage':
-        grp1 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == 'danish') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]
-        grp2 = df[(df['variable'] == selected_variable) & (df['year'] == int(selected_year)) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == 'nonwestern') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]
-        grp1 = grp1[~grp1['KOMKODE'].isin(missing_mun_list)]
-        grp2 = grp2[~grp2['KOMKODE'].isin(missing_mun_list)]
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale='RdBu_r',
-                            # range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'DKK'},
-                            color_continuous_midpoint=0
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], grp1['observations'], grp2['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.0f}<br>" +\
-                "Antal danskere: %{customdata[2]:,}<br>" +\
-                "Antal ikke-vestlige indvandrere og efterkommere: %{customdata[3]:,}<br>"
-            )
+        grp1, grp2 = cube.pair('heritage', ('danish', 'nonwestern'), selected_year, dfs['KOMKODE'], variable=selected_variable, gender=selected_gender, age=selected_age, education=selected_education, labor=selected_labor)
+        diverging = True
+        colorbar_title = 'DKK'
+        observations = (grp1, grp2)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.0f}<br>" +\
+            "Antal danskere: %{customdata[2]:,}<br>" +\
+            "Antal ikke-vestlige indvandrere og efterkommere: %{customdata[3]:,}<br>"
         )
         anno_text2 = '(Rød indikerer, at danskere har en højere indkomst)'
     elif selected_measure == 'Gini' or selected_measure.startswith('Theil_') or selected_measure[1].isdigit():
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: ''},
-                            # color_continuous_midpoint=np.mean(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.3f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = ''
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.3f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
     elif selected_measure == 'mean':
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: 'DKK'},
-                            # color_continuous_midpoint=np.median(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.0f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = 'DKK'
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.0f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
 
     else:
-        fig = px.choropleth(dfs, geojson=geojson, color=selected_measure,
-                            locations="KOMKODE",
-                            featureidkey="properties.KOMKODE",
-                            projection="mercator",
-                            color_continuous_scale=colorscale_level,
-                            range_color=[dfs[selected_measure].min(), dfs[selected_measure].max()],
-                            labels={selected_measure: ''},
-                            # color_continuous_midpoint=np.median(dfs[selected_measure]),
-                           )
-        fig.update_traces(
-            customdata= np.stack((dfs['municipality'], dfs[selected_measure], dfs['observations']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Værdi: %{customdata[1]:,.0f}<br>" +\
-                "Antal observationer: %{customdata[2]:,}"
-            )
+        diverging = False
+        colorbar_title = ''
+        observations = (dfs['observations'],)
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"+\
+            "Værdi: %{customdata[1]:,.0f}<br>" +\
+            "Antal observationer: %{customdata[2]:,}"
         )
 
-    fig.update_geos(fitbounds="locations", visible=False)
     if selected_measure == 'mean' or selected_measure.startswith('diff'):
-        fig.update_layout(
-            coloraxis_colorbar_tickformat=',.000',
-        )
+        tickformat = ',.000'
     else:
-        fig.update_layout(
-            coloraxis_colorbar_tickformat='',
-        )
-    fig.update_layout(
-        font_family='Avenir Next',
-        margin={"r":0,"t":0,"l":0,"b":0},
-        font_size=12,
-        # coloraxis_colorbar_tickformat=',.000',
-        separators=",..",
-        autosize=True,
-        coloraxis=dict(
-            colorbar_x=-0.05
-        ),
-    )
-
-    ##### Add square around Bornholm #####
-    factorx = 0.1
-    factory = 0.065
-    x = [12.682574-factorx, 12.682574-factorx, 13.193236+factorx, 13.193236+factorx, 12.682574-factorx]
-    y = [56.986583-factory, 57.323286+factory, 57.323286+factory, 56.986583-factory, 56.986583-factory]
-    Bsquare = px.line_geo(lat=y, lon=x, projection='mercator',  color_discrete_sequence=['rgb(0,0,0)']*5)
-    Bsquare.data[0].showlegend=False
-    Bsquare.update_traces(
-       hovertemplate=None,
-       hoverinfo='skip'
-    )
-    fig.add_trace(Bsquare.data[0])
+        tickformat = ''
     anno_text1 = f'År: {selected_year}'
     if 'anno_text2' not in locals():
             anno_text2 = ''
     anno_text_final = '<br>'.join(filter(None, [anno_text1, anno_text2]))
-    fig.add_annotation(x=0.5, y=0, text=anno_text_final, showarrow=False)
-
-    if len(rdf) > 0: # if some municipalities are missing
-        missing_map = px.choropleth(rdf, geojson=geojson, color="val",
-                            locations="KOMKODE", featureidkey="properties.KOMKODE",
-                            projection="mercator", color_discrete_map={'missing':'gray'},
-                           )
-        missing_map.data[0].showlegend=False
-        missing_map.update_traces(
-            customdata= np.stack((rdf['municipality'], rdf['val']), axis=-1),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"+\
-                "Få observationer" + \
-                "<extra></extra>"
-            )
-        )
+    return map_payload(dfs['KOMKODE'], dfs[selected_measure], observations, hovertemplate,
+                       diverging=diverging, colorbar_title=colorbar_title, tickformat=tickformat, annotation=anno_text_final)
 
-        fig.add_trace(missing_map.data[0])
-    return fig
+# recolor on new values, outline the hovered municipality (assets/maps.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='maps', function_name='recolor'),
+    Output('income-map-graph', 'figure'),
+    [Input('income-map-values', 'data'),
+    Input('income-map-graph', 'hoverData')],
+    [State('income-map-base', 'data'),
+    State('income-map-graph', 'figure')]
+)
 @app.callback(
     Output('income-line-graph', 'figure'),
     [
@@ -889,20 +733,18 @@ def update_map(selected_variable, selected_measure, selected_gender, selected_ag
     Input('income-color-memory', 'data'),
     ]
 )
+@line_cache.memoize
 def update_line_graph(selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor, clickData, color):
-    dfs = df[(df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor) & (df['variable'] == selected_variable)]
-
-    line_all = dfs[dfs['KOMKODE'] == 0]
+    line_all = cube.series(KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
     hele_danmark_color = 'rgb(242,146,12)'
     fig = go.Figure()
 
 
     ##### section for diff_* maps #####
     if selected_measure == 'diff_education':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == 'low') & (df['labor'] == selected_labor)]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == 'high') & (df['labor'] == selected_labor)]['observations'])
+        grp1, grp2 = cube.pair_series('education', ('low', 'high'), KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, labor=selected_labor)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 meta=[f'Antal uden videregående udd.: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal med videregående udd.: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -915,11 +757,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == 'low') & (df['labor'] == selected_labor)]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == 'high') & (df['labor'] == selected_labor)]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                grp1l, grp2l = cube.pair_series('education', ('low', 'high'), municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, labor=selected_labor)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -933,10 +774,9 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                 ))
 
     elif selected_measure == 'diff_labor':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'unskilled')]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'skilled')]['observations'])
+        grp1, grp2 = cube.pair_series('labor', ('unskilled', 'skilled'), KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 text=[f'Antal m. grundskole som højest fuldførte udd.: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal m. højere udd. end grundskole: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -949,11 +789,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'unskilled')]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == 'skilled')]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                grp1l, grp2l = cube.pair_series('labor', ('unskilled', 'skilled'), municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -966,10 +805,9 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                     "<extra></extra>"
                 ))
     elif selected_measure == 'diff_gender':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'woman') & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'man') & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
+        grp1, grp2 = cube.pair_series('gender', ('woman', 'man'), KOMKODE=0, variable=selected_variable, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 text=[f'Antal kvinder: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal mænd: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -982,11 +820,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'woman') & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == 'man') & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == selected_heritage) & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                grp1l, grp2l = cube.pair_series('gender', ('woman', 'man'), municipality=clickData[l], variable=selected_variable, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -999,10 +836,9 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                     "<extra></extra>"
                 ))
     elif selected_measure == 'diff_heritage':
-        grp1 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == 'danish') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
-        grp2 = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['KOMKODE'] == 0) & (df['heritage'] == 'nonwestern') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
+        grp1, grp2 = cube.pair_series('heritage', ('danish', 'nonwestern'), KOMKODE=0, variable=selected_variable, gender=selected_gender, age=selected_age, education=selected_education, labor=selected_labor)
 
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color),
                                 text=[f'Antal danskere: {format(int(grp1[i]), ",d").replace(",", ".")} <br>Antal ikke-vestlige indvandrere og efterkommere: {format(int(grp2[i]), ",d").replace(",", ".")}' for i in range(len(grp1))],
                                 hovertemplate=
@@ -1015,11 +851,10 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                grp1l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == 'danish') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
-                grp2l = list(df[(df['variable'] == selected_variable) & (df['gender'] == selected_gender) & (df['age'] == selected_age) & (df['municipality'] == clickData[l]) & (df['heritage'] == 'nonwestern') & (df['education'] == selected_education) & (df['labor'] == selected_labor)]['observations'])
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                grp1l, grp2l = cube.pair_series('heritage', ('danish', 'nonwestern'), municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, education=selected_education, labor=selected_labor)
 
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
                 meta=clickData[l],
@@ -1032,7 +867,7 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                     "<extra></extra>"
                 ))
     elif selected_measure == 'Gini' or selected_measure == 'Theil_L' or selected_measure == 'Theil_T' or selected_measure[1].isdigit():
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color), meta=line_all['observations'],
                                 hovertemplate=
                                 '<b>Hele Danmark</b><br>'+
@@ -1044,11 +879,11 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
-                text=[f'{clickData[l]}' for _ in range(len(df['year'].unique()))],
+                text=[f'{clickData[l]}' for _ in range(len(cube.years))],
                 meta=dfl['observations'],
                 hovertemplate=
                 '<b>%{text}</b><br>'+
@@ -1057,7 +892,7 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
                 'Antal observationer: %{meta:,}'
                 "<extra></extra>"))
     else:
-        fig.add_trace(go.Scatter(x=df['year'].unique(), y=line_all[selected_measure], name='Hele Danmark',
+        fig.add_trace(go.Scatter(x=cube.years, y=line_all[selected_measure], name='Hele Danmark',
                                 mode='lines', line=dict(color=hele_danmark_color), meta=line_all['observations'],
                                 hovertemplate=
                                 '<b>Hele Danmark</b><br>'+
@@ -1069,11 +904,11 @@ def update_line_graph(selected_variable, selected_measure, selected_gender, sele
 
         if clickData is not None:
             for l in range(len(clickData)):
-                dfl = dfs[dfs['municipality'] == clickData[l]]
-                fig.add_trace(go.Scatter(x=df['year'].unique(), y=dfl[selected_measure],
+                dfl = cube.series(municipality=clickData[l], variable=selected_variable, gender=selected_gender, age=selected_age, heritage=selected_heritage, education=selected_education, labor=selected_labor)
+                fig.add_trace(go.Scatter(x=cube.years, y=dfl[selected_measure],
                 name=clickData[l],
                 mode='lines', line=dict(color=color[l]),
-                text=[f'{clickData[l]}' for _ in range(len(df['year'].unique()))],
+                text=[f'{clickData[l]}' for _ in range(len(cube.years))],
                 meta=dfl['observations'],
                 hovertemplate=
                 '<b>%{text}</b><br>'+
@@ -1149,22 +984,8 @@ def download_map_csv():
     education = flask.request.args.get('education')
     labor = flask.request.args.get('labor')
     year = flask.request.args.get('year')
-    dff = df[(df['variable'] == variable) & (df['year'] == int(year)) & (df['gender'] == gender) & (df['age'] == age) & (df['heritage'] == heritage) & (df['education'] == education) & (df['labor'] == labor)].copy()
-    df_out = dff[['KOMKODE', 'observations', 'year', measure]]
-
-    str_io = io.StringIO()
-    df_out.to_csv(str_io, index=False, header=['kommunekode', 'antal observationer', 'aar', 'vaerdi'])
-
-    mem = io.BytesIO()
-    mem.write(str_io.getvalue().encode('utf-8'))
-    mem.seek(0)
-    str_io.close()
-    return flask.send_file(mem,
-                           mimetype='text/csv',
-                           attachment_filename='RFF-kort.csv',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    dff = cube.select(variable=variable, year=year, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    return send_csv(dff, measure, 'RFF-kort.csv', 'income')
 
 @app.callback(
     Output('income-download-csv-series', 'href'),
@@ -1207,78 +1028,152 @@ def download_series_csv():
     labor = flask.request.args.get('labor')
     municipalities = [int(m) for m in flask.request.args.getlist('municipalities')]
 
-    dff = df[(df['variable'] == variable) & (df['gender'] == gender) & (df['age'] == age) & (df['heritage'] == heritage) & (df['education'] == education) & (df['labor'] == labor) & (df['KOMKODE'].isin(municipalities))].copy()
-    df_out = dff[['KOMKODE', 'observations', 'year', measure]]
-
-    str_io = io.StringIO()
-    df_out.to_csv(str_io, index=False, header=['kommunekode', 'antal observationer', 'aar', 'vaerdi'])
-
-    mem = io.BytesIO()
-    mem.write(str_io.getvalue().encode('utf-8'))
-    mem.seek(0)
-    str_io.close()
-    return flask.send_file(mem,
-                           mimetype='text/csv',
-                           attachment_filename='RFF-serie.csv',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    dff = cube.select(variable=variable, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    rows = np.flatnonzero(np.isin(dff['KOMKODE'].values, municipalities)) # positions in the slice, no filtered copy
+    return send_csv(dff, measure, 'RFF-serie.csv', 'income', rows)
 
 @app.callback(
-    Output('income-download-png-series', 'href'),
+    [Output('income-download-png-series', 'href'),
+     Output('income-download-svg-series', 'href'),
+     Output('income-download-pdf-series', 'href')],
     [Input('income-download-png-series-button', 'n_clicks'),
-     Input('income-line-graph', 'figure')]
- )
-def link_download_series_image(click, fig):
-    if fig is None:
-        raise PreventUpdate
-    else:
-        img_bytes = plotly.io.to_image(fig, format='png', engine='kaleido') # img as bytes
-        out = base64.b64encode(img_bytes) # encoded
-        query_param = {'encoding': out}
-        query_string = urllib.parse.urlencode(query_param, doseq=True)
-        return f"/downloadSeriesImg?{query_string}"
+     Input('income-variable-selector', 'value'),
+     Input('income-measure-selector', 'value'),
+     Input('income-gender-selector', 'value'),
+     Input('income-age-selector', 'value'),
+     Input('income-heritage-selector', 'value'),
+     Input('income-education-selector', 'value'),
+     Input('income-labor-selector', 'value'),
+     Input('income-memory', 'data'),
+     Input('income-color-memory', 'data')]
+)
+def link_download_series_image(click, selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor, municipalities, colors):
+    query_params = {'variable': selected_variable,
+                    'measure': selected_measure,
+                    'gender': selected_gender,
+                    'age': selected_age,
+                    'heritage': selected_heritage,
+                    'education': selected_education,
+                    'labor': selected_labor,
+                    'municipalities': municipalities or [],
+                    'colors': colors or [],
+                    }
+    query_string = urllib.parse.urlencode(query_params, doseq=True)
+    url = f"/downloadSeriesImg?{query_string}" # rendered when clicked, see download_series_img
+    return url, url + '&format=svg', url + '&format=pdf'
 
 @app.server.route('/downloadSeriesImg')
 def download_series_img():
-    encoding = flask.request.args.get('encoding').encode('utf-8') # load as string and encode to bytes
-    decoded = base64.b64decode(encoding)
-    img_io = io.BytesIO(decoded)
-    img_io.seek(0)
-    return flask.send_file(img_io,
-                           mimetype='image/png',
-                           attachment_filename='RFF-serie.png',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    variable = flask.request.args.get('variable')
+    measure = flask.request.args.get('measure')
+    gender = flask.request.args.get('gender')
+    age = flask.request.args.get('age')
+    heritage = flask.request.args.get('heritage')
+    education = flask.request.args.get('education')
+    labor = flask.request.args.get('labor')
+    municipalities = flask.request.args.getlist('municipalities') or None
+    colors = flask.request.args.getlist('colors') or None
+    format = flask.request.args.get('format', 'png')
+    if format not in IMAGE_FORMATS:
+        flask.abort(400)
+    check_selection(cube, measure, municipalities=municipalities, colors=colors, variable=variable, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    # the memoized callback, i.e. the figure on screen
+    fig = update_line_graph.__wrapped__(variable, measure, gender, age, heritage, education, labor, municipalities, colors)
+    return send_artifact(render_image(fig, format), IMAGE_FORMATS[format], f'RFF-serie.{format}')
 
 @app.callback(
-    Output('income-download-png-map', 'href'),
+    [Output('income-download-png-map', 'href'),
+     Output('income-download-svg-map', 'href'),
+     Output('income-download-pdf-map', 'href')],
     [Input('income-download-png-map-button', 'n_clicks'),
-     Input('income-map-graph', 'figure')]
- )
-def link_download_map_image(click, fig):
-    if fig is None:
-        raise PreventUpdate
-    else:
-        img_bytes = plotly.io.to_image(fig, format='png', engine='kaleido') # img as bytes
-        out = base64.b64encode(img_bytes) # encoded
-        query_param = {'encoding': out}
-        query_string = urllib.parse.urlencode(query_param, doseq=True)
-        return f"/downloadMapImg?{query_string}"
+     Input('income-variable-selector', 'value'),
+     Input('income-measure-selector', 'value'),
+     Input('income-gender-selector', 'value'),
+     Input('income-age-selector', 'value'),
+     Input('income-heritage-selector', 'value'),
+     Input('income-education-selector', 'value'),
+     Input('income-labor-selector', 'value'),
+     Input('income-year-selector', 'value')]
+)
+def link_download_map_image(click, selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor, selected_year):
+    query_params = {'variable': selected_variable,
+                    'measure': selected_measure,
+                    'gender': selected_gender,
+                    'age': selected_age,
+                    'heritage': selected_heritage,
+                    'education': selected_education,
+                    'labor': selected_labor,
+                    'year': selected_year
+                    }
+    query_string = urllib.parse.urlencode(query_params, doseq=True)
+    url = f"/downloadMapImg?{query_string}" # rendered when clicked, see download_map_img
+    return url, url + '&format=svg', url + '&format=pdf'
 
 @app.server.route('/downloadMapImg')
 def download_map_img():
-    encoding = flask.request.args.get('encoding').encode('utf-8') # load as string and encode to bytes
-    decoded = base64.b64decode(encoding)
-    img_io = io.BytesIO(decoded)
-    img_io.seek(0)
-    return flask.send_file(img_io,
-                           mimetype='image/png',
-                           attachment_filename='RFF-kort.png',
-                           as_attachment=True,
-                           cache_timeout=0
-    )
+    variable = flask.request.args.get('variable')
+    measure = flask.request.args.get('measure')
+    gender = flask.request.args.get('gender')
+    age = flask.request.args.get('age')
+    heritage = flask.request.args.get('heritage')
+    education = flask.request.args.get('education')
+    labor = flask.request.args.get('labor')
+    year = flask.request.args.get('year')
+    format = flask.request.args.get('format', 'png')
+    if format not in IMAGE_FORMATS:
+        flask.abort(400)
+    check_selection(cube, measure, years=[year], variable=variable, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    payload = update_map.__wrapped__(variable, measure, gender, age, heritage, education, labor, year) # the memoized callback
+    fig = inline_geometry(map_figure(payload), EXPORT_LEVELS[format]) # less detail for vectors
+    return send_artifact(render_image(fig, format), IMAGE_FORMATS[format], f'RFF-kort.{format}')
+
+@app.callback(
+    [Output('income-download-zip-map', 'href'),
+     Output('income-download-gif-map', 'href')],
+    [Input('income-variable-selector', 'value'),
+     Input('income-measure-selector', 'value'),
+     Input('income-gender-selector', 'value'),
+     Input('income-age-selector', 'value'),
+     Input('income-heritage-selector', 'value'),
+     Input('income-education-selector', 'value'),
+     Input('income-labor-selector', 'value')]
+)
+def link_download_map_years(selected_variable, selected_measure, selected_gender, selected_age, selected_heritage, selected_education, selected_labor):
+    query_params = {'variable': selected_variable,
+                    'measure': selected_measure,
+                    'gender': selected_gender,
+                    'age': selected_age,
+                    'heritage': selected_heritage,
+                    'education': selected_education,
+                    'labor': selected_labor,
+                    }
+    query_string = urllib.parse.urlencode(query_params, doseq=True)
+    return f"/downloadMapYears?{query_string}&format=zip", f"/downloadMapYears?{query_string}&format=gif"
+
+@app.server.route('/downloadMapYears')
+def download_map_years():
+    """
+    Every year of the map selection, as zip of PNGs or as animated GIF (smaller
+    thumb geometry). Frames are rendered in parallel and cached like single maps.
+    """
+    variable = flask.request.args.get('variable')
+    measure = flask.request.args.get('measure')
+    gender = flask.request.args.get('gender')
+    age = flask.request.args.get('age')
+    heritage = flask.request.args.get('heritage')
+    education = flask.request.args.get('education')
+    labor = flask.request.args.get('labor')
+    format = flask.request.args.get('format')
+    if format not in ('zip', 'gif'):
+        flask.abort(400, 'format must be zip or gif')
+    animation = format == 'gif'
+    check_selection(cube, measure, variable=variable, gender=gender, age=age, heritage=heritage, education=education, labor=labor)
+    figs = [inline_geometry(map_figure(update_map.__wrapped__(variable, measure, gender, age, heritage, education, labor, year)), 'thumb' if animation else 'png') for year in cube.years]
+    frames = render_many(figs)
+    if animation:
+        return send_artifact(animated_gif(frames), 'image/gif', 'RFF-kort.gif')
+    files = {f'RFF-kort-{year}.png': frame for year, frame in zip(cube.years, frames)}
+    return send_artifact(zip_files(files), 'application/zip', 'RFF-kort.zip')
 
 
 
@@ -7,39 +7,6 @@ import base64
 RF_orange = 'rgb(242,146,12)'
 RF_gray = 'rgb(244,246,248)'
 
-def get_highlights(selection, geojson, district_lookup):
-    """
-    For selecting a single municipality. Returns geojson for only selection
-    Args:
-        selection: KOMKODE (int)
-        geojson: geojson
-        district_lookup: KOMKODE as key and coordinates as value (dict)
-    """
-    geojson_highlights = dict()
-    for k in geojson.keys():
-        if k != 'features':
-            geojson_highlights[k] = geojson[k]
-        else:
-            geojson_highlights[k] = district_lookup[selection]
-    return geojson_highlights
-
-def get_coordinates(kom, d):
-    length = len(d[kom]['geometry']['coordinates'])
-    ddict = d[kom]
-    x = []
-    y = []
-    if length > 1:
-        for i in range(length):
-            _x = [v[0] for v in ddict['geometry']['coordinates'][i][0]]
-            x.append(_x)
-            _y = [v[1] for v in ddict['geometry']['coordinates'][i][0]]
-            y.append(_y)
-            return length, x, y
-    else:
-        x = [v[0] for v in ddict['geometry']['coordinates'][0]]
-        y = [v[1] for v in ddict['geometry']['coordinates'][0]]
-        return length, x, y
-
 def path2file(fname: str) -> str:
     """
     Returns path relative to current work directory.
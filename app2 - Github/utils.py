@@ -7,39 +7,6 @@ import base64
 RF_orange = 'rgb(242,146,12)'
 RF_gray = 'rgb(244,246,248)'
 
-def get_highlights(selection, geojson, district_lookup):
-    """
-    For selecting a single municipality. Returns geojson for only selection
-    Args:
-        selection: KOMKODE (int)
-        geojson: geojson
-        district_lookup: KOMKODE as key and coordinates as value (dict)
-    """
-    geojson_highlights = dict()
-    for k in geojson.keys():
-        if k != 'features':
-            geojson_highlights[k] = geojson[k]
-        else:
-            geojson_highlights[k] = district_lookup[selection]
-    return geojson_highlights
-
-def get_coordinates(kom, d):
-    length = len(d[kom]['geometry']['coordinates'])
-    ddict = d[kom]
-    x = []
-    y = []
-    if length > 1:
-        for i in range(length):
-            _x = [v[0] for v in ddict['geometry']['coordinates'][i][0]]
-            x.append(_x)
-            _y = [v[1] for v in ddict['geometry']['coordinates'][i][0]]
-            y.append(_y)
-            return length, x, y
-    else:
-        x = [v[0] for v in ddict['geometry']['coordinates'][0]]
-        y = [v[1] for v in ddict['geometry']['coordinates'][0]]
-        return length, x, y
-
 def path2file(fname: str) -> str:
     """
     Returns path relative to current work directory.
@@ -64,6 +31,16 @@ def download_dropdown(page: str):
         dbc.DropdownMenuItem('Download graf (PNG)', header=True),
         html.A(dbc.DropdownMenuItem('Kommunekort', id=page+'-download-png-map-button'), id=page+'-download-png-map'),
         html.A(dbc.DropdownMenuItem('Tidsserie', id=page+'-download-png-series-button'), id=page+'-download-png-series'),
+        dbc.DropdownMenuItem(divider=True),
+        dbc.DropdownMenuItem('Download vektorgrafik (SVG/PDF)', header=True),
+        html.A(dbc.DropdownMenuItem('Kommunekort (SVG)', id=page+'-download-svg-map-button'), id=page+'-download-svg-map'),
+        html.A(dbc.DropdownMenuItem('Kommunekort (PDF)', id=page+'-download-pdf-map-button'), id=page+'-download-pdf-map'),
+        html.A(dbc.DropdownMenuItem('Tidsserie (SVG)', id=page+'-download-svg-series-button'), id=page+'-download-svg-series'),
+        html.A(dbc.DropdownMenuItem('Tidsserie (PDF)', id=page+'-download-pdf-series-button'), id=page+'-download-pdf-series'),
+        dbc.DropdownMenuItem(divider=True),
+        dbc.DropdownMenuItem('Download alle år', header=True),
+        html.A(dbc.DropdownMenuItem('Kommunekort (ZIP med PNG)', id=page+'-download-zip-map-button'), id=page+'-download-zip-map'),
+        html.A(dbc.DropdownMenuItem('Kommunekort (animeret GIF)', id=page+'-download-gif-map-button'), id=page+'-download-gif-map'),
         # dbc.DropdownMenuItem(divider=True),
         # dbc.DropdownMenuItem('Download skærmbillede (PDF)', header=True),
         # dbc.DropdownMenuItem('Snapshot'),